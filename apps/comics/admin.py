@@ -1,10 +1,11 @@
 from django.contrib import admin
+from django.utils.html import escape
 from django.utils.safestring import mark_safe
 from django import forms
 from django.contrib.admin.widgets import FilteredSelectMultiple
 
 from apps.comics.models import Comic, Page, TagType, Tag, Ad, AliasUrl, StyleConfiguration, \
-    LinkedSocialPlatform, SocialPlatform, CodeSnippet, HeaderLink, Chapter, ShortCodeRedirect
+    LinkedSocialPlatform, SocialPlatform, CodeSnippet, HeaderLink, Chapter, ShortCodeRedirect, ImageJob
 
 admin.site.register(Chapter)
 admin.site.register(TagType)
@@ -51,11 +52,21 @@ class CodeSnippetAdmin(admin.ModelAdmin):
 
 @admin.register(Page)
 class PageAdmin(admin.ModelAdmin):
-    list_display = ('title', 'ordering', 'comic', 'post_transcript_alt', 'tag_list')
-    list_filter = ('comic', 'tags')
+    list_display = ('title', 'ordering', 'comic', 'post_transcript_alt', 'tag_list', 'image_status')
+    list_filter = ('comic', 'tags', 'image_job__status')
+    list_select_related = ('comic', 'image_job')
     filter_horizontal = ('tags',)
     search_fields = ('title', 'slug',)
 
+    @admin.display(description="Images", ordering='image_job__status')
+    def image_status(self, obj):
+        job = getattr(obj, 'image_job', None)
+        if job is None:
+            return "-"
+        if job.status == ImageJob.FAILED:
+            return mark_safe(f'<span title="{escape(job.error)}">{job.get_status_display()}</span>')
+        return job.get_status_display()
+
     def post_transcript_alt(self, obj):
         post = "✓" if obj.post else "✗"
         transcript = "✓" if obj.transcript else "✗"
@@ -117,8 +128,8 @@ class TagAdmin(admin.ModelAdmin):
 
 @admin.register(Ad)
 class AdAdmin(admin.ModelAdmin):
-    list_display = ('thumbnail', 'type', 'url', 'comic', 'active',)
-    list_editable = ('active',)
+    list_display = ('thumbnail', 'type', 'url', 'comic', 'active', 'weight',)
+    list_editable = ('active', 'weight',)
     list_filter = ('active', 'comic')
 
     def thumbnail(self, obj):
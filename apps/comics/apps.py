@@ -1,6 +1,11 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class ComicsConfig(AppConfig):
     name = 'apps.comics'
     verbose_name = 'Comics'
+
+    def ready(self):
+        from apps.comics import database
+        connection_created.connect(database.configure_sqlite)
@@ -0,0 +1,155 @@
+import hashlib
+import time
+from datetime import datetime, timezone
+
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.decorators import method_decorator
+from django.utils.http import urlencode
+from django.utils.timezone import now
+from django.views.decorators.http import condition
+
+from apps.comics import database, navigation, routing
+
+# Rendered responses are kept this long at most, even if nothing changes and nothing is scheduled.
+RESPONSE_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def _generation_key(comic_id):
+    return f"comics:{comic_id}:generation"
+
+
+def get_generation(comic_id):
+    """Every response cached for a comic is stored under its current generation number."""
+    generation = cache.get(_generation_key(comic_id))
+    if generation is None:
+        generation = time.time_ns()
+        # Another worker may have started one first. Without a cache, every call starts a new generation.
+        if not cache.add(_generation_key(comic_id), generation, None):
+            generation = cache.get(_generation_key(comic_id), generation)
+    return generation
+
+
+def clear_responses(comic_id):
+    """Move the comic on to a new generation. Its old responses are never read again, and age out of the cache."""
+    cache.set(_generation_key(comic_id), time.time_ns(), None)
+
+
+def comic_key(comic_id, *parts):
+    """A cache key for data derived from the comic, which becomes stale whenever anything on the comic changes."""
+    return ":".join(str(part) for part in ("comics", comic_id, get_generation(comic_id), *parts))
+
+
+def get_timeout(comic):
+    """How long something that depends on which pages are published can be cached: until the next scheduled page
+    goes live, and a day at most."""
+    expires_at = navigation.get_navigation_index(comic).expires_at
+    if expires_at is None:
+        return RESPONSE_CACHE_TIMEOUT
+    return min(RESPONSE_CACHE_TIMEOUT, max(1, int((expires_at - now()).total_seconds()) + 1))
+
+
+def _response_key(view):
+    # Only the parameters the view reads, so tracking parameters and cache busters don't each store another copy
+    request = view.request
+    query = urlencode(sorted(
+        (name, value) for name in view.cache_query_params for value in request.GET.getlist(name)))
+    url = hashlib.md5(f"{request.scheme}://{request.get_host()}{request.path}?{query}".encode()).hexdigest()
+    return comic_key(request.comic.id, "response", url)
+
+
+def _is_cacheable(view):
+    request = view.request
+    return (
+        view.cache_responses and
+        request.method == "GET" and
+        request.comic is not None and
+        # Editors should always see their changes straight away
+        not request.user.is_authenticated
+    )
+
+
+def _tee(chunks, key, status, headers, timeout):
+    content = []
+    chunks = iter(chunks)
+    while True:
+        with database.primary_reads():
+            chunk = next(chunks, None)
+        if chunk is None:
+            break
+        content.append(chunk)
+        yield chunk
+    cache.set(key, (b"".join(content), status, headers), timeout)
+
+
+def cache_response(cls):
+    """A View class decorator that caches the rendered response of its GET method, per comic and host.
+
+    Cached responses are dropped whenever anything on the comic changes, and expire when the next scheduled page goes
+    live. Set `cache_responses = False` on a subclass to opt out.
+
+    Responses are cached by path, and by the query parameters named in the view's `cache_query_params`. Any other
+    parameter is ignored, so list every parameter the view reads there.
+    """
+    def outside(func):
+        def wrapper(self, *args, **kwargs):
+            if not _is_cacheable(self):
+                return func(self, *args, **kwargs)
+
+            key = _response_key(self)
+            cached = cache.get(key)
+            if cached is not None:
+                content, status, headers = cached
+                return HttpResponse(content, status=status, headers=headers)
+
+            # Every reader gets this response, so render it from the primary database rather than a replica
+            with database.primary_reads():
+                response = func(self, *args, **kwargs)
+                if hasattr(response, "render"):
+                    response.render()
+            # A comic edit may have been committed while this rendered with the old copy from the routing table
+            if response.status_code != 200 or response.cookies or routing.is_stale(self.request.comic):
+                return response
+
+            timeout = get_timeout(self.request.comic)
+            if response.streaming:
+                # Cache the body once it has all been sent, so the first reader still gets it as it's rendered
+                response.streaming_content = _tee(
+                    response.streaming_content, key, response.status_code, dict(response.items()), timeout)
+            else:
+                cache.set(key, (response.content, response.status_code, dict(response.items())), timeout)
+            return response
+        return wrapper
+    cls.cache_responses = True
+    cls.cache_query_params = getattr(cls, "cache_query_params", ())
+    cls.get = outside(cls.get)
+    return cls
+
+
+def get_last_modified(comic):
+    """The last time anything a reader can see on the comic changed: when its current generation started, or when a
+    scheduled page went live since."""
+    # HTTP dates are in whole seconds. Rounding up keeps a change from looking older than a response sent just before
+    changed_at = datetime.fromtimestamp(-(-get_generation(comic.id) // 10**9), timezone.utc)
+    published_at = navigation.get_navigation_index(comic).published_at
+    return max(filter(None, [changed_at, published_at]))
+
+
+def get_etag(comic):
+    """Changes whenever anything on the comic is saved or deleted, or a scheduled page goes live."""
+    return f"{get_generation(comic.id)}-{len(navigation.get_navigation_index(comic))}"
+
+
+def _last_modified_func(request, *args, **kwargs):
+    return get_last_modified(request.comic) if request.comic else None
+
+
+def _etag_func(request, *args, **kwargs):
+    return get_etag(request.comic) if request.comic else None
+
+
+def conditional_response(cls):
+    """A View class decorator that adds ETag and Last-Modified headers to its GET responses, and answers matching
+    If-None-Match or If-Modified-Since requests with a 304 before doing any work.
+    """
+    return method_decorator(condition(etag_func=_etag_func, last_modified_func=_last_modified_func), name="get")(cls)
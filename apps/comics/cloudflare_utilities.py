@@ -1,29 +1,134 @@
-from typing import List
+import atexit
+import logging
+import threading
+import time
+from typing import Iterable
 
 import requests
+from django.conf import settings
 
+logger = logging.getLogger(__name__)
 
-def purge_paths(comic, paths: List[str], everything=False):
+# Cloudflare rejects purge requests that list more files than this.
+PURGE_FILES_PER_CALL = 30
+
+# Past this many files, one purge_everything is cheaper than a long run of targeted calls.
+MAX_PURGE_FILES = PURGE_FILES_PER_CALL * 5
+
+
+class PurgeQueue:
+    """Collects cache purges and sends them to Cloudflare from a background thread.
+
+    Purges for the same zone that arrive within `window` seconds of each other are merged into as few API calls as
+    possible, so saving a hundred rows in the admin costs a handful of requests instead of a hundred. Failed calls are
+    retried with exponential backoff.
+    """
+    def __init__(self, api_url=None, window=2.0, max_attempts=5, backoff=1.0, timeout=10):
+        self.api_url = api_url
+        self.window = window
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.timeout = timeout
+        self._condition = threading.Condition()
+        self._pending = {}  # zone -> {"token": str, "everything": bool, "files": dict of url -> None}
+        self._in_flight = 0
+        self._thread = None
+
+    def enqueue(self, zone, token, files=(), everything=False):
+        with self._condition:
+            entry = self._pending.setdefault(zone, {"token": token, "everything": False, "files": {}})
+            entry["token"] = token
+            entry["everything"] = entry["everything"] or everything
+            if not entry["everything"]:
+                entry["files"].update(dict.fromkeys(files))
+            self._ensure_thread()
+            self._condition.notify_all()
+
+    def flush(self):
+        """Send everything that's queued right now, and wait for any batch the worker thread is sending."""
+        self._send_all(self._take_pending())
+        with self._condition:
+            self._condition.wait_for(lambda: self._in_flight == 0)
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="cloudflare-purge", daemon=True)
+            self._thread.start()
+
+    def _take_pending(self):
+        with self._condition:
+            pending, self._pending = self._pending, {}
+            self._in_flight += 1
+            return pending
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending)
+            # Give other saves in the same admin action a chance to join this batch
+            time.sleep(self.window)
+            self._send_all(self._take_pending())
+
+    def _send_all(self, pending):
+        try:
+            for zone, entry in pending.items():
+                for body in self._build_bodies(entry):
+                    self._send(zone, entry["token"], body)
+        finally:
+            with self._condition:
+                self._in_flight -= 1
+                self._condition.notify_all()
+
+    @staticmethod
+    def _build_bodies(entry):
+        if entry["everything"]:
+            return [{"purge_everything": True}]
+        files = list(entry["files"])
+        return [{"files": files[i:i + PURGE_FILES_PER_CALL]} for i in range(0, len(files), PURGE_FILES_PER_CALL)]
+
+    def _send(self, zone, token, body):
+        url = f"{self.api_url or settings.CLOUDFLARE_API_URL}/zones/{zone}/purge_cache"
+        headers = {
+            "Authorization": f"Bearer {token}",
+            "Content-Type": "application/json",
+        }
+        for attempt in range(self.max_attempts):
+            try:
+                response = requests.post(url, json=body, headers=headers, timeout=self.timeout)
+                if response.status_code != 429 and response.status_code < 500:
+                    data = response.json()
+                    if not data["success"]:
+                        logger.error("Cloudflare purge failed for zone %s: %s", zone, data["errors"][0]["message"])
+                    return
+                logger.warning("Cloudflare purge for zone %s returned %s", zone, response.status_code)
+            except (requests.RequestException, ValueError) as e:
+                logger.warning("Cloudflare purge for zone %s failed: %s", zone, e)
+            if attempt + 1 < self.max_attempts:
+                time.sleep(self.backoff * 2 ** attempt)
+        logger.error("Giving up on Cloudflare purge for zone %s after %s attempts", zone, self.max_attempts)
+
+
+PURGE_QUEUE = PurgeQueue()
+
+# Management commands (eg. loaddata) exit as soon as they finish, so send whatever they queued on the way out.
+atexit.register(PURGE_QUEUE.flush)
+
+
+def purge_paths(comic, paths: Iterable[str], everything=False):
     # Don't purge paths if we don't have Cloudflare configured
     if not comic.cloudflare_zone or not comic.cloudflare_token:
         return
 
+    paths = list(paths)
+    if len(paths) > MAX_PURGE_FILES:
+        everything = True
+
     # TODO: Don't leave this testing override in!
     comic.domain = "swordscomic.com"
 
-    if everything:
-        body = {"purge_everything": True}
-    else:
-        body = {"files": [f"https://{comic.domain}{p}" for p in paths]}
-
-    url = f"https://api.cloudflare.com/client/v4/zones/{comic.cloudflare_zone}/purge_cache"
-    headers = {
-        "Authorization": f"Bearer {comic.cloudflare_token}",
-        "Content-Type": "application/json",
-    }
-    response = requests.post(url, json=body, headers=headers).json()
-    if not response["success"]:
-        raise Exception(response["errors"][0]["message"])
+    PURGE_QUEUE.enqueue(
+        comic.cloudflare_zone, comic.cloudflare_token,
+        files=[f"https://{comic.domain}{p}" for p in paths], everything=everything)
 
 
 def build_resize_url(path: str, width: int) -> str:
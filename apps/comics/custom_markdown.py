@@ -1,13 +1,23 @@
+import hashlib
 import itertools
 import re
+import time
 
+from django.core.cache import cache
 from django.db.models import Q
 from django.urls import reverse
 from markdown2 import Markdown
 
+from apps.comics import database
+
 
 TAG_REFERENCE_RE = re.compile(r"<([\w\- ]+):([\w\- ]+)>", re.I)
 
+# Rendered HTML depends on the source text and on which tags exist, so cached renders are keyed on both. Any Tag or
+# TagType change moves the tag version on, and the old renders age out of the cache.
+TAG_VERSION_KEY = "comics:markdown:tag-version"
+RENDER_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
 
 def grouper(iterable, n):
     """
@@ -25,17 +35,19 @@ class BetterMarkdown(Markdown):
     def preprocess(self, text):
         parts = list(TAG_REFERENCE_RE.split(text))
 
+        from apps.comics.models import Tag, lower
+
         # Run over the objects once to build the query
         query = Q()
         for markdown_chunk, tag_type, tag in grouper(parts, 3):
             if tag_type and tag:
-                query |= Q(type__title__iexact=tag_type, title__iexact=tag)
-
-        # Fetch the requested tags from the DB
+                query |= Q(type__title__lower=lower(tag_type), title__lower=lower(tag))
 
-        from apps.comics.models import Tag
-        tag_objects = Tag.objects.filter(query).select_related("type")
-        tags_and_icons = {(t.type.title.lower(), t.title.lower()): t.icon_url for t in tag_objects}
+        # Fetch the requested tags from the DB, unless there are none (an empty query would fetch every tag)
+        tags_and_icons = {}
+        if query:
+            tag_objects = Tag.objects.filter(query).select_related("type")
+            tags_and_icons = {(t.type.title.lower(), t.title.lower()): t.icon_url for t in tag_objects}
 
         # Iterate over the objects again to replace the areas with the correct markup
         new_text = ""
@@ -59,9 +71,32 @@ class BetterMarkdown(Markdown):
 MARKDOWN_ENGINE = BetterMarkdown()
 
 
+def _tag_version():
+    version = cache.get(TAG_VERSION_KEY)
+    if version is None:
+        cache.add(TAG_VERSION_KEY, time.time_ns(), None)
+        version = cache.get(TAG_VERSION_KEY)
+    return version
+
+
+def clear_render_cache(*args, **kwargs):
+    """Invalidate every cached render. Accepts (and ignores) signal arguments so it can be used as a receiver."""
+    cache.set(TAG_VERSION_KEY, time.time_ns(), None)
+
+
 def render(text) -> str:
-    """Render an HTML version of the text."""
-    return MARKDOWN_ENGINE.convert(text)
+    """Render an HTML version of the text. Results are cached until a Tag or TagType changes."""
+    if not text:
+        return MARKDOWN_ENGINE.convert(text)
+
+    digest = hashlib.sha256(text.encode()).hexdigest()
+    key = f"comics:markdown:{_tag_version()}:{digest}"
+    html = cache.get(key)
+    if html is None:
+        with database.primary_reads():
+            html = str(MARKDOWN_ENGINE.convert(text))
+        cache.set(key, html, RENDER_CACHE_TIMEOUT)
+    return html
 
 
 def render_txt(text) -> str:
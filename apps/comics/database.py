@@ -0,0 +1,119 @@
+import contextvars
+import random
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, OperationalError
+
+# The optional database the public reader views read from. See `ReplicaRouter`.
+REPLICA = "replica"
+
+# Statements that find the database locked are retried this many times, backing off from this many seconds
+BUSY_RETRIES = 5
+BUSY_BACKOFF = 0.05
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """Apply `settings.SQLITE_PRAGMAS` to every new SQLite connection, and retry statements that find it locked."""
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        for pragma, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {pragma} = {value}")
+        if connection.alias == REPLICA:
+            # Nothing should be written to the replica, even if it is the primary's own file
+            cursor.execute("PRAGMA query_only = ON")
+    # The same wrapper object outlives its connection, so don't stack a retry on every reconnect
+    if retry_when_busy not in connection.execute_wrappers:
+        connection.execute_wrappers.append(retry_when_busy)
+
+
+def retry_when_busy(execute, sql, params, many, context):
+    """Retry a statement that failed because another process is writing.
+
+    The connection's timeout already waits for most locks. This catches the ones SQLite gives up on straight away.
+    Statements inside a transaction aren't retried, because the whole transaction would have to start again.
+    """
+    connection = context["connection"]
+    for attempt in range(BUSY_RETRIES):
+        try:
+            return execute(sql, params, many, context)
+        except OperationalError as e:
+            if "locked" not in str(e) or connection.in_atomic_block or attempt + 1 == BUSY_RETRIES:
+                raise
+            time.sleep(BUSY_BACKOFF * 2 ** attempt * random.uniform(0.5, 1.5))
+
+
+_reads_from_replica = contextvars.ContextVar("reads_from_replica", default=False)
+
+
+def read_from(replica):
+    """Send this context's reads of the comics models to the replica database (if one is configured) or not, until the
+    returned token is passed to `restore_reads`."""
+    return _reads_from_replica.set(replica)
+
+
+def restore_reads(token):
+    _reads_from_replica.reset(token)
+
+
+@contextmanager
+def _reading_from(replica):
+    token = read_from(replica)
+    try:
+        yield
+    finally:
+        restore_reads(token)
+
+
+def replica_reads():
+    """Inside this block, reads of the comics models go to the replica database, if one is configured."""
+    return _reading_from(True)
+
+
+def primary_reads():
+    """Inside this block, reads go to `default`, even within `replica_reads()`.
+
+    Anything stored in the shared cache is read like this. Every worker serves it until the next change, so it must
+    never be older than the primary, however far behind the replica is.
+    """
+    return _reading_from(False)
+
+
+def iterate_on_replica(chunks):
+    """Produce a streamed response body with each chunk's reads going to the replica, as they did in its view."""
+    chunks = iter(chunks)
+    while True:
+        with replica_reads():
+            chunk = next(chunks, None)
+        if chunk is None:
+            return
+        yield chunk
+
+
+class ReplicaRouter:
+    """Send the reads made in `replica_reads()` blocks to the `replica` database, so the public reader views can scale
+    separately from editing. Only the comics models are routed there; sessions and users always come from `default`.
+
+    Everything else, including every write, the admin and management commands, uses `default`. Without a `replica`
+    in `DATABASES`, this router does nothing.
+    """
+    def db_for_read(self, model, **hints):
+        if _reads_from_replica.get() and model._meta.app_label == "comics" and REPLICA in settings.DATABASES:
+            return REPLICA
+        return None
+
+    def db_for_write(self, model, **hints):
+        # Otherwise objects read from the replica would be saved back to it
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both databases hold the same rows
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        # The replica is a copy of the primary, so it gets its schema from there
+        if db == REPLICA:
+            return False
+        return None
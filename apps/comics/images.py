@@ -0,0 +1,108 @@
+import io
+import os
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from apps.comics.cloudflare_utilities import build_resize_url
+
+# Page images are resized to each of these widths (if they're wider), in both WebP and JPEG
+RENDITION_WIDTHS = (480, 960, 1440)
+
+# Generated thumbnails are square. The archive tiles show them at about half this size, so a half size copy is made too.
+THUMBNAIL_SIZE = 300
+SMALL_THUMBNAIL_SIZE = THUMBNAIL_SIZE // 2
+GENERATED_THUMBNAIL_SUFFIX = ".thumb.webp"
+
+WEBP_QUALITY = 80
+JPEG_QUALITY = 85
+
+# What a missing, unreadable or oversized image raises
+IMAGE_ERRORS = (OSError, Image.DecompressionBombError)
+
+
+def rendition_name(name, width, extension):
+    """Renditions are stored beside the original: `Comic/images/page.png` -> `Comic/images/page.960w.webp`."""
+    stem, _ = os.path.splitext(name)
+    return f"{stem}.{width}w.{extension}"
+
+
+def rendition_url(name, width, extension):
+    return default_storage.url(rendition_name(name, width, extension))
+
+
+def rendition_widths(width):
+    return [w for w in RENDITION_WIDTHS if w < width]
+
+
+def build_srcset(page, extension):
+    """A `srcset` of the page's renditions in one format. The JPEG set also offers the original at its full width."""
+    if page.comic.cloudflare_resize:
+        # Cloudflare picks the best format itself
+        if extension != "jpg":
+            return ""
+        return ", ".join(f"{build_resize_url(page.image.url, w)} {w}w" for w in RENDITION_WIDTHS)
+    if not page.image_width:
+        return ""
+    candidates = [(rendition_url(page.image.name, w, extension), w) for w in rendition_widths(page.image_width)]
+    if extension == "jpg":
+        candidates.append((page.image.url, page.image_width))
+    return ", ".join(f"{url} {w}w" for url, w in candidates)
+
+
+def _flatten(image):
+    """JPEG has no transparency, so put transparent images on a white background."""
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, "white")
+        background.paste(image, mask=image.getchannel("A"))
+        return background
+    return image.convert("RGB")
+
+
+def _save(image, name, format, **options):
+    buffer = io.BytesIO()
+    image.save(buffer, format, **options)
+    if default_storage.exists(name):
+        default_storage.delete(name)
+    return default_storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def _open(field_file):
+    with field_file.open("rb") as f:
+        image = Image.open(f)
+        image.load()
+    return ImageOps.exif_transpose(image)
+
+
+def build_page_images(page):
+    """Write the page's renditions and small thumbnail, and generate a thumbnail if it doesn't have one.
+
+    Sets `image_width` (and `thumbnail`, if generated) on the page and in the database, without sending signals.
+    """
+    from apps.comics.models import Page
+
+    image = _open(page.image)
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if image.mode in ("LA", "P") else "RGB")
+
+    for width in rendition_widths(image.width):
+        resized = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+        _save(resized, rendition_name(page.image.name, width, "webp"), "WEBP", quality=WEBP_QUALITY)
+        _save(_flatten(resized), rendition_name(page.image.name, width, "jpg"), "JPEG",
+              quality=JPEG_QUALITY, optimize=True, progressive=True)
+
+    if page.thumbnail and not page.thumbnail.name.endswith(GENERATED_THUMBNAIL_SUFFIX):
+        thumbnail = _open(page.thumbnail)
+    else:
+        # Generated thumbnails are remade along with the image they came from
+        thumbnail = ImageOps.fit(image, (THUMBNAIL_SIZE, THUMBNAIL_SIZE), Image.LANCZOS)
+        stem, _ = os.path.splitext(os.path.basename(page.image.name))
+        page.thumbnail.name = _save(thumbnail, page.get_thumbnail_file_path(f"{stem}{GENERATED_THUMBNAIL_SUFFIX}"),
+                                    "WEBP", quality=WEBP_QUALITY)
+    small = ImageOps.fit(thumbnail, (SMALL_THUMBNAIL_SIZE, SMALL_THUMBNAIL_SIZE), Image.LANCZOS)
+    _save(small, rendition_name(page.thumbnail.name, SMALL_THUMBNAIL_SIZE, "webp"), "WEBP", quality=WEBP_QUALITY)
+
+    page.image_width = image.width
+    Page.objects.filter(pk=page.pk).update(image_width=page.image_width, thumbnail=page.thumbnail.name)
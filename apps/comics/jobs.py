@@ -0,0 +1,59 @@
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import django
+
+logger = logging.getLogger(__name__)
+
+
+def build_images(page_id):
+    """Resize a page's images, then clear the caches that show them. Runs in a worker process."""
+    from apps.comics import images
+    from apps.comics.models import Page
+
+    page = Page.objects.select_related('comic').get(pk=page_id)
+    images.build_page_images(page)
+    Page.clear_cache(Page, page)
+
+
+def run_worker(processes=None, interval=2.0, once=False):
+    """Work through queued image jobs on a pool of `processes` (default: one per core), checking for new jobs every
+    `interval` seconds. With `once`, return as soon as the queue is empty instead.
+
+    Between jobs, this also rewrites the static data of comics whose every page changed, away from the requests that
+    changed them, and of comics whose scheduled pages have gone live."""
+    from apps.comics import static_data
+    from apps.comics.models import ImageJob
+
+    processes = processes or os.cpu_count()
+
+    # Jobs left running belonged to a worker that died, so start them again
+    ImageJob.objects.filter(status=ImageJob.RUNNING).update(status=ImageJob.PENDING)
+
+    # Fresh processes set up Django themselves, rather than sharing the database connections of a forked parent
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(processes, mp_context=context, initializer=django.setup) as pool:
+        running = {}
+        while True:
+            static_data.rebuild_requested()
+            for job in ImageJob.objects.claim(processes - len(running)):
+                running[pool.submit(build_images, job.page_id)] = job
+
+            if not running:
+                if once:
+                    return
+                time.sleep(interval)
+                continue
+
+            done, _ = wait(running, timeout=interval, return_when=FIRST_COMPLETED)
+            for future in done:
+                job = running.pop(future)
+                error = future.exception()
+                if error is None:
+                    job.finish()
+                else:
+                    logger.warning("Resizing the images of page %s failed: %s", job.page_id, error)
+                    job.fail(error)
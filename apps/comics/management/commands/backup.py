@@ -1,8 +1,33 @@
+import gzip
+import hashlib
+import json
 import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
 from zipfile import ZipFile
 
-from django.core import management
-from django.core.management.base import BaseCommand, no_translations
+from django.apps import apps
+from django.core import management, serializers
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError, no_translations
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, connections, router, transaction
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
+
+MEDIA_DIR = "deploy/media"
+
+# Files in these formats are already compressed, so they're stored as they are rather than gzipped again
+COMPRESSED_EXTENSIONS = {
+    ".png", ".jpg", ".jpeg", ".gif", ".webp", ".avif", ".mp3", ".mp4", ".webm", ".zip", ".gz", ".woff", ".woff2",
+}
+
+# How many records go into each chunk of an incremental database dump
+DUMP_CHUNK_SIZE = 1000
+
+HASH_BLOCK_SIZE = 1024 * 1024
 
 
 def dump_data(filename):
@@ -28,12 +53,269 @@ def load_data(filename):
         infile.extractall()
 
     print("Loading database records...")
-    management.call_command('loaddata', 'data.json')
+    with _muted_signals():
+        management.call_command('loaddata', 'data.json')
+    _refresh_comics()
 
     print("Cleaning up...")
     os.remove('data.json')
 
 
+@contextmanager
+def _muted_signals():
+    """Turn off every save, delete and m2m receiver. Otherwise each restored row would clear caches and send its own
+    Cloudflare purge; `_refresh_comics` does that once for everything afterwards."""
+    saved = [(signal, signal.receivers) for signal in (pre_save, post_save, pre_delete, post_delete, m2m_changed)]
+    for signal, _ in saved:
+        signal.receivers = []
+        signal.sender_receivers_cache.clear()
+    try:
+        yield
+    finally:
+        for signal, receivers in saved:
+            signal.receivers = receivers
+            signal.sender_receivers_cache.clear()
+
+
+def _refresh_comics():
+    from apps.comics import static_data
+    from apps.comics.models import Comic, clear_comic_cache
+
+    print("Clearing caches...")
+    cache.clear()
+    for comic in Comic.objects.all():
+        clear_comic_cache(comic)
+        static_data.schedule_update(comic)
+
+
+def _hash_file(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def _object_name(digest, compress):
+    return os.path.join("objects", digest[:2], digest + (".gz" if compress else ""))
+
+
+def _store_object(directory, digest, compress, source):
+    """Copy `source` (a file object) into the backup as an object named after its hash, unless it's already there."""
+    name = _object_name(digest, compress)
+    path = os.path.join(directory, name)
+    if os.path.exists(path):
+        return name
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, temporary = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, 'wb') as f:
+        if compress:
+            with gzip.GzipFile(fileobj=f, mode='wb', mtime=0) as compressed:
+                shutil.copyfileobj(source, compressed, HASH_BLOCK_SIZE)
+        else:
+            shutil.copyfileobj(source, f, HASH_BLOCK_SIZE)
+    os.replace(temporary, path)
+    return name
+
+
+def _read_latest_manifest(directory):
+    manifests = os.path.join(directory, "manifests")
+    names = sorted(n for n in os.listdir(manifests) if n.endswith(".json")) if os.path.isdir(manifests) else []
+    if not names:
+        return None
+    with open(os.path.join(manifests, names[-1])) as f:
+        return json.load(f)
+
+
+def _dump_media(directory, previous):
+    """Store every media file that isn't already in the backup. Files with the same size and modification time as in
+    the previous manifest aren't even read again."""
+    previous = previous["media"] if previous else {}
+    media = {}
+    stored = 0
+    for dirname, subdirs, files in os.walk(MEDIA_DIR):
+        for filename in files:
+            path = os.path.join(dirname, filename)
+            relative = os.path.relpath(path, MEDIA_DIR)
+            stat = os.stat(path)
+            entry = previous.get(relative)
+            if (entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime_ns and
+                    os.path.exists(os.path.join(directory, entry["object"]))):
+                media[relative] = entry
+                continue
+
+            digest = _hash_file(path)
+            compress = os.path.splitext(filename)[1].lower() not in COMPRESSED_EXTENSIONS
+            with open(path, 'rb') as source:
+                name = _store_object(directory, digest, compress, source)
+            media[relative] = {"sha256": digest, "size": stat.st_size, "mtime": stat.st_mtime_ns, "object": name}
+            stored += 1
+    print(f"Stored {stored} new or changed media files of {len(media)}.")
+    return media
+
+
+def _dumped_models():
+    """Every model `dumpdata` would dump, in an order that can be loaded back."""
+    app_list = [(config, None) for config in apps.get_app_configs() if config.models_module is not None]
+    return [
+        model for model in serializers.sort_dependencies(app_list, allow_cycles=True)
+        if not model._meta.proxy and router.allow_migrate_model(DEFAULT_DB_ALIAS, model)
+    ]
+
+
+def _dump_records(directory):
+    """Serialize the database a chunk of records at a time. Chunks that haven't changed since an earlier backup hash
+    the same, so they're only stored once."""
+    chunks = []
+    for model in _dumped_models():
+        queryset = model._default_manager.order_by(model._meta.pk.name)
+        chunk = []
+        for obj in queryset.iterator(chunk_size=DUMP_CHUNK_SIZE):
+            chunk.append(obj)
+            if len(chunk) == DUMP_CHUNK_SIZE:
+                chunks.append(_store_records(directory, model, chunk))
+                chunk = []
+        if chunk:
+            chunks.append(_store_records(directory, model, chunk))
+    print(f"Stored {sum(c['count'] for c in chunks)} records in {len(chunks)} chunks.")
+    return chunks
+
+
+def _store_records(directory, model, objects):
+    data = serializers.serialize("json", objects).encode()
+    digest = hashlib.sha256(data).hexdigest()
+    with tempfile.TemporaryFile() as source:
+        source.write(data)
+        source.seek(0)
+        name = _store_object(directory, digest, True, source)
+    return {"model": model._meta.label_lower, "count": len(objects), "sha256": digest, "object": name}
+
+
+def dump_incremental(directory):
+    os.makedirs(os.path.join(directory, "manifests"), exist_ok=True)
+    previous = _read_latest_manifest(directory)
+
+    print("Writing database records...")
+    records = _dump_records(directory)
+
+    print("Writing media files...")
+    media = _dump_media(directory, previous)
+
+    # The manifest is written last, so an interrupted backup leaves the previous one as the latest. Names sort in the
+    # order they were written, down to the microsecond, and linking never replaces another run's manifest.
+    fd, temporary = tempfile.mkstemp(dir=os.path.join(directory, "manifests"), suffix=".tmp")
+    try:
+        while True:
+            created_at = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S.%f")
+            manifest = {"created_at": created_at, "records": records, "media": media}
+            with open(fd, 'w', closefd=False) as f:
+                f.seek(0)
+                f.truncate()
+                json.dump(manifest, f)
+            path = os.path.join(directory, "manifests", f"{created_at}.json")
+            try:
+                os.link(temporary, path)
+                break
+            except FileExistsError:
+                continue
+    finally:
+        os.close(fd)
+        os.remove(temporary)
+    print(f"Wrote {path}.")
+
+
+def _extract_object(directory, entry, destination):
+    """Copy an object out of the backup to `destination`, checking its hash on the way. Returns an error or None."""
+    source_path = os.path.join(directory, entry["object"])
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    fd, temporary = tempfile.mkstemp(dir=os.path.dirname(destination), suffix=".tmp")
+    sha256 = hashlib.sha256()
+    try:
+        with os.fdopen(fd, 'wb') as f, _open_object(source_path) as source:
+            for block in iter(lambda: source.read(HASH_BLOCK_SIZE), b""):
+                sha256.update(block)
+                f.write(block)
+    except (OSError, EOFError) as e:
+        os.remove(temporary)
+        return f"{destination}: {e}"
+    if sha256.hexdigest() != entry["sha256"]:
+        os.remove(temporary)
+        return f"{destination}: checksum mismatch"
+    os.replace(temporary, destination)
+    return None
+
+
+def _open_object(path):
+    return gzip.open(path, 'rb') if path.endswith(".gz") else open(path, 'rb')
+
+
+def _read_records(directory, entry):
+    with _open_object(os.path.join(directory, entry["object"])) as f:
+        data = f.read()
+    if hashlib.sha256(data).hexdigest() != entry["sha256"]:
+        raise CommandError(f"Records chunk {entry['object']} ({entry['model']}) is corrupt: checksum mismatch")
+    return data
+
+
+def _load_records(directory, records):
+    """Load the chunks of records in order, one transaction each, with foreign keys checked once at the end."""
+    connection = connections[DEFAULT_DB_ALIAS]
+    models = set()
+    deferred = []
+    with connection.constraint_checks_disabled():
+        for entry in records:
+            data = _read_records(directory, entry)
+            with transaction.atomic():
+                for obj in serializers.deserialize("json", data, handle_forward_references=True):
+                    obj.save()
+                    models.add(type(obj.object))
+                    if obj.deferred_fields:
+                        deferred.append(obj)
+        # Natural keys that pointed at records from later chunks can be resolved now
+        with transaction.atomic():
+            for obj in deferred:
+                obj.save_deferred_fields()
+    connection.check_constraints(table_names=[model._meta.db_table for model in models])
+
+    # Some databases need their sequences moving past the restored primary keys
+    sequence_sql = connection.ops.sequence_reset_sql(no_style(), models)
+    if sequence_sql:
+        with connection.cursor() as cursor:
+            for sql in sequence_sql:
+                cursor.execute(sql)
+    print(f"Loaded {sum(entry['count'] for entry in records)} records.")
+
+
+def load_incremental(directory, manifest_name=None, threads=None):
+    if manifest_name:
+        with open(os.path.join(directory, "manifests", manifest_name)) as f:
+            manifest = json.load(f)
+    else:
+        manifest = _read_latest_manifest(directory)
+        if manifest is None:
+            raise CommandError(f"There are no backups in {directory}.")
+    print(f"Restoring the backup from {manifest['created_at']}...")
+
+    # Media files are extracted on a thread pool while the records load, since both mostly wait on the disk
+    with ThreadPoolExecutor(threads) as pool:
+        print("Loading media files...")
+        extractions = [
+            pool.submit(_extract_object, directory, entry, os.path.join(MEDIA_DIR, relative))
+            for relative, entry in manifest["media"].items()
+        ]
+
+        print("Loading database records...")
+        with _muted_signals():
+            _load_records(directory, manifest["records"])
+
+        errors = [error for error in (future.result() for future in extractions) if error]
+    if errors:
+        raise CommandError("Some media files couldn't be restored:\n" + "\n".join(errors))
+    print(f"Restored {len(extractions)} media files.")
+
+    _refresh_comics()
+
+
 class Command(BaseCommand):
     help = """Dump or load a backup archive containing the entire server's data.
 
@@ -42,17 +324,40 @@ class Command(BaseCommand):
      - Media Files
 
      Usage: `./manage.py backup [dump|load] (filename.zip)`
+
+     With `--incremental`, the backup is a directory instead, which can be dumped into again and again. Media files
+     and chunks of records are stored once each, named by their SHA-256, and each run writes a manifest listing which
+     of them make up that backup. Only new or changed files are copied, and files in formats that are already
+     compressed are stored as they are.
+
+     Usage: `./manage.py backup dump --incremental (directory)`
+
+     Loading an incremental backup restores its latest manifest (or `--manifest`), checking every file against its
+     hash. Media files are extracted in parallel, and records load in one transaction per chunk without firing any
+     signals. Caches are cleared and Cloudflare purged once at the end.
+
+     Usage: `./manage.py backup load --incremental (directory) [--manifest (name.json)]`
     """
 
     def add_arguments(self, parser):
         parser.add_argument('action', choices=['dump', 'load'], type=str)
         parser.add_argument('filename', type=str)
+        parser.add_argument('--incremental', action='store_true',
+                            help="Dump into or load from a content-addressed backup directory.")
+        parser.add_argument('--manifest', type=str, default=None,
+                            help="The manifest to load from an incremental backup (default: the latest).")
+        parser.add_argument('--threads', type=int, default=None,
+                            help="How many media files to extract at once.")
 
     @no_translations
     def handle(self, *args, **options):
         action = options['action']
         filename = options['filename']
-        if action == 'dump':
+        if options['incremental'] and action == 'dump':
+            dump_incremental(filename)
+        elif options['incremental'] and action == 'load':
+            load_incremental(filename, options['manifest'], options['threads'])
+        elif action == 'dump':
             dump_data(filename)
         elif action == 'load':
             load_data(filename)
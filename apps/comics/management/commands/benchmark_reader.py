@@ -0,0 +1,145 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError, no_translations
+from django.db import connections, transaction
+from django.db.backends.signals import connection_created
+from django.db.models import F
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from apps.comics import database
+from apps.comics.models import Comic, Page
+from apps.comics.navigation import get_navigation_index
+
+# The database settings from before the production profile: SQLite's defaults, a new connection for every request,
+# the sqlite3 module's own 5 second lock timeout and no retries
+UNTUNED_PRAGMAS = {'journal_mode': 'DELETE', 'synchronous': 'FULL', 'mmap_size': 0, 'cache_size': -2000}
+
+# Every request has to reach the database, rather than the response cache
+NO_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+
+class Command(BaseCommand):
+    help = """Measure how many reader requests per second a comic serves, with and without the production database
+    profile: `SQLITE_PRAGMAS`, `CONN_MAX_AGE`, the lock timeout and retrying statements that find the database locked.
+
+    Requests go through the whole Django stack from several threads at once, with caching turned off. With
+    `--writer`, another thread keeps writing to the comic's pages meanwhile, like the admin and the image worker do.
+    Run it against a copy of the production database, on the production server, while nothing else is using it.
+
+     Usage: `./manage.py benchmark_reader [domain] [--requests N] [--threads N] [--writer]`
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('domain', nargs='?', help="The comic to read (default: the first one).")
+        parser.add_argument('--requests', type=int, default=500, help="Requests per thread, for each profile.")
+        parser.add_argument('--threads', type=int, default=3, help="Requests at once (gunicorn runs 3 per worker).")
+        parser.add_argument('--writer', action='store_true', help="Write to the database while reading.")
+
+    @no_translations
+    def handle(self, *args, **options):
+        comics = Comic.objects.all()
+        if options['domain']:
+            comics = comics.filter(domain=options['domain'])
+        comic = comics.first()
+        if comic is None:
+            raise CommandError("There's no comic to read.")
+
+        paths = self._get_paths(comic)
+        if not paths:
+            raise CommandError(f"{comic} has no published pages.")
+
+        settings_dict = connections['default'].settings_dict
+        profiles = [
+            ("untuned", UNTUNED_PRAGMAS, {'CONN_MAX_AGE': 0, 'OPTIONS': {}}, False),
+            ("tuned", settings.SQLITE_PRAGMAS, {
+                'CONN_MAX_AGE': settings_dict['CONN_MAX_AGE'], 'OPTIONS': settings_dict['OPTIONS']}, True),
+        ]
+        results = {}
+        for name, pragmas, database_settings, retries in profiles:
+            with override_settings(SQLITE_PRAGMAS=pragmas, CACHES=NO_CACHES):
+                results[name] = self._run(comic, paths, database_settings, retries, options['threads'],
+                                          options['requests'], options['writer'])
+            self.stdout.write(f"{name}: {results[name]:.1f} requests/second")
+        self.stdout.write(f"The tuned profile serves {results['tuned'] / results['untuned']:.2f}x as many requests.")
+
+    def _get_paths(self, comic):
+        """A mix of the pages people read: reader pages and their data, the archive and the feed."""
+        slugs = [entry.slug for entry in get_navigation_index(comic).entries]
+        paths = []
+        for slug in slugs[-20:]:
+            paths.append(reverse('reader', kwargs={'page': slug}))
+            paths.append(reverse('page-metadata', kwargs={'page': slug}))
+        if paths:
+            paths += [reverse('comic-metadata'), reverse('archive-index'), reverse('archive-pages'), reverse('feed')]
+        return paths
+
+    def _run(self, comic, paths, database_settings, retries, threads, requests, writer):
+        """Requests per second from `threads` clients making `requests` requests each, and maybe a writer."""
+        # Start from fresh connections, so the settings apply and the journal mode can change. Every thread's
+        # connection shares this settings dict.
+        connections.close_all()
+        connections['default'].settings_dict.update(database_settings)
+        if not retries:
+            connection_created.connect(_without_retries)
+        try:
+            return self._measure(comic, paths, threads, requests, writer)
+        finally:
+            connection_created.disconnect(_without_retries)
+
+    def _measure(self, comic, paths, threads, requests, writer):
+        errors = []
+        finished = threading.Event()
+
+        def read():
+            client = Client(HTTP_HOST=comic.domain)
+            try:
+                for i in range(requests):
+                    path = paths[i % len(paths)]
+                    response = client.get(path)
+                    if response.status_code != 200:
+                        raise CommandError(f"{path} returned {response.status_code}.")
+                    if response.streaming:
+                        b"".join(response.streaming_content)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections.close_all()
+
+        def write():
+            # Updates without changing anything, so no signals are sent and the comic is left as it was
+            pages = Page.objects.filter(comic=comic)
+            try:
+                while not finished.is_set():
+                    with transaction.atomic():
+                        pages.update(image_width=F('image_width'))
+                    time.sleep(0.01)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections.close_all()
+
+        workers = [threading.Thread(target=read) for _ in range(threads)]
+        if writer:
+            writer = threading.Thread(target=write)
+            writer.start()
+        started_at = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started_at
+        finished.set()
+        if writer:
+            writer.join()
+
+        if errors:
+            raise errors[0]
+        return threads * requests / elapsed
+
+
+def _without_retries(sender, connection, **kwargs):
+    if database.retry_when_busy in connection.execute_wrappers:
+        connection.execute_wrappers.remove(database.retry_when_busy)
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, no_translations
+
+from apps.comics import images
+from apps.comics.models import Page
+
+
+class Command(BaseCommand):
+    help = """Make the resized copies and thumbnails of page images.
+
+    Pages do this themselves when their image changes, so this is only needed for pages from before that, or after
+    changing the sizes in `apps/comics/images.py`.
+
+     Usage: `./manage.py build_images [--all]`
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Rebuild every page, not only those never resized.")
+
+    @no_translations
+    def handle(self, *args, **options):
+        pages = Page.objects.select_related('comic')
+        if not options['all']:
+            pages = pages.filter(image_width=None)
+
+        for page in pages.iterator():
+            try:
+                images.build_page_images(page)
+            except images.IMAGE_ERRORS as e:
+                self.stderr.write(f"Skipped {page}: {e}")
+            else:
+                self.stdout.write(f"Resized {page}.")
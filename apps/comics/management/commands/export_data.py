@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError, no_translations
+
+from apps.comics import static_data
+from apps.comics.models import Comic
+
+
+class Command(BaseCommand):
+    help = """Write the reader's JSON for every published page, and for the comic itself, to static files.
+
+    The files are written to `<media>/<comic title>/data/`, where the reader fetches them from before falling back to
+    Django. While DJANGO_STATIC_PAGE_DATA is set, saves and the image worker keep them up to date, scheduled pages
+    included, so this only needs to run once.
+
+     Usage: `./manage.py export_data [domain ...]`
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('domains', nargs='*', type=str, help="Only export these comics (default: all of them).")
+
+    @no_translations
+    def handle(self, *args, **options):
+        comics = Comic.objects.all()
+        if options['domains']:
+            comics = comics.filter(domain__in=options['domains'])
+            if len(comics) != len(set(options['domains'])):
+                raise CommandError("Some of those domains don't belong to a comic.")
+
+        for comic in comics:
+            urls = static_data.update(comic)
+            self.stdout.write(f"Wrote {len(urls)} files for {comic}.")
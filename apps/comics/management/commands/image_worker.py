@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, no_translations
+
+from apps.comics import jobs
+
+
+class Command(BaseCommand):
+    help = """Resize page images in the background, as pages are saved.
+
+    Run exactly one of these next to the web server. It spreads the work over a pool of processes, and retries
+    failed jobs a few times before marking them as failed in the Page admin. With DJANGO_STATIC_PAGE_DATA set, it
+    also rewrites the static data of comics when a change touches every page, or a scheduled page goes live.
+
+     Usage: `./manage.py image_worker [--processes N] [--once]`
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=None, help="How many images to resize at once "
+                                                                         "(default: one per core).")
+        parser.add_argument('--interval', type=float, default=2.0, help="Seconds between checks for new jobs.")
+        parser.add_argument('--once', action='store_true', help="Exit once the queue is empty.")
+
+    @no_translations
+    def handle(self, *args, **options):
+        jobs.run_worker(options['processes'], options['interval'], options['once'])
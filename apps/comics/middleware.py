@@ -1,6 +1,6 @@
 from django.http import HttpResponseRedirect
 
-from apps.comics.models import Comic, AliasUrl
+from apps.comics import database, routing
 
 
 class ComicUrlMiddleware:
@@ -14,22 +14,44 @@ class ComicUrlMiddleware:
 
     def __call__(self, request):
         host = request.META['HTTP_HOST'].split(':')[0]
+        comic, is_alias = routing.resolve(host)
 
         # First check if the request is coming from an alias URL, if so, redirect it to the canonical one.
-        try:
-            alias = AliasUrl.objects.get(domain=host)
-            new_url = f"{request.scheme}://{alias.comic.domain}{request.path}"
+        if is_alias:
+            new_url = f"{request.scheme}://{comic.domain}{request.path}"
             if request.META['QUERY_STRING']:
                 new_url += f"?{request.META['QUERY_STRING']}"
             return HttpResponseRedirect(new_url)
-        except AliasUrl.DoesNotExist:
-            pass
 
         # Calculate the requested comic from the url
-        try:
-            request.comic = Comic.objects.get(domain=host)
-        except Comic.DoesNotExist:
-            request.comic = None
+        request.comic = comic
 
         response = self.get_response(request)
         return response
+
+
+class ReplicaMiddleware:
+    """
+    Send the reads of views with `use_replica` set (see `apps.comics.views.read_from_replica`) to the replica database,
+    while they run, while their template renders and while a streamed response is sent.
+
+    Editors always read from the primary, so they see their changes straight away.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.replica_token = None
+        try:
+            response = self.get_response(request)
+        finally:
+            if request.replica_token is not None:
+                database.restore_reads(request.replica_token)
+        if request.replica_token is not None and response.streaming:
+            response.streaming_content = database.iterate_on_replica(response.streaming_content)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if (getattr(getattr(view_func, 'view_class', None), 'use_replica', False) and
+                not request.user.is_authenticated):
+            request.replica_token = database.read_from(True)
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.1 on 2026-10-18 18:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comics', '0061_delete_indexurl_remove_comic_adsense_ad_slot_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ad',
+            name='weight',
+            field=models.PositiveSmallIntegerField(default=1, help_text='How often this ad is chosen compared to the others. An ad with a weight of 2 is shown twice as often as one with a weight of 1. Zero means it is never shown.'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.1 on 2026-10-18 18:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comics', '0062_ad_weight'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comic',
+            name='random_shuffle_bag',
+            field=models.BooleanField(default=False, help_text="If True, the random page redirect won't repeat a page for a reader until they have seen every page."),
+        ),
+    ]
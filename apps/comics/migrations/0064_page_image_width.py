@@ -0,0 +1,24 @@
+# Generated by Django 4.2.1 on 2026-10-18 18:24
+
+import apps.comics.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comics', '0063_comic_random_shuffle_bag'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='page',
+            name='image_width',
+            field=models.PositiveIntegerField(blank=True, editable=False, help_text='Set once the resized copies of the image have been made.', null=True),
+        ),
+        migrations.AlterField(
+            model_name='page',
+            name='thumbnail',
+            field=models.ImageField(blank=True, help_text='Recommended size: 300x300px. Leave blank to generate one from the image.', null=True, upload_to=apps.comics.models.Page.get_thumbnail_file_path),
+        ),
+    ]
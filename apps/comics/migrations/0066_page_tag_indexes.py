@@ -0,0 +1,30 @@
+# Generated by Django 4.2.1 on 2026-10-18 18:40
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comics', '0065_imagejob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='page',
+            index=models.Index(fields=['comic', 'ordering', 'posted_at'], name='comics_page_reader_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='page',
+            index=models.Index(models.F('comic'), django.db.models.functions.text.Lower('slug'), name='comics_page_lower_slug_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(models.F('type'), django.db.models.functions.text.Lower('title'), name='comics_tag_lower_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tagtype',
+            index=models.Index(django.db.models.functions.text.Lower('title'), name='comics_tagtype_lower_title_idx'),
+        ),
+    ]
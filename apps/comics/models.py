@@ -1,15 +1,63 @@
+import itertools
+import random
+from datetime import timedelta
+
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
-from django.db import models
-from django.db.models import Q
-from django.db.models.signals import post_save
+from django.db import models, transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Lower
+from django.db.models.signals import post_save, post_delete, m2m_changed
 from django.urls import reverse
 from django.utils.timezone import now
 
-from apps.comics import custom_markdown
+from apps.comics import caching, custom_markdown, database, images, navigation, routing, static_data
 from apps.comics.cloudflare_utilities import purge_paths, build_resize_url
 
 
-class Comic(models.Model):
+# `title__lower=lower(value)` matches like `title__iexact=value`, but can use the lower-case indexes below. SQLite can't
+# use an index for `iexact`, which it runs as a LIKE.
+models.CharField.register_lookup(Lower)
+
+
+def lower(value):
+    return Lower(Value(value))
+
+
+class LoadedValuesMixin:
+    """Remembers the field values an instance was loaded with, so signal handlers can tell what a save changed."""
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def loaded_value(self, field):
+        return getattr(self, '_loaded_values', {}).get(field, getattr(self, field))
+
+
+def clear_comic_cache(comic, paths=None):
+    """Drop the comic's cached responses, rewrite its static data, and purge `paths` from its CDN (or everything, if
+    `paths` is None).
+
+    Only the static data of the pages among `paths` is rewritten, with the comic's own file and the pages whose links
+    moved. Changes that touch every page's data have to ask for that with `static_data.schedule_update(comic)`.
+    """
+    # Only once the change is committed: until then, other requests would cache the old data under the new generation
+    transaction.on_commit(lambda: caching.clear_responses(comic.id))
+    static_data.schedule_update(comic, static_data.page_slugs(paths or []))
+    purge_paths(comic, paths or [], everything=paths is None)
+
+
+def page_paths(slug):
+    """The URLs that render a single page."""
+    return [
+        reverse("reader", kwargs={"page": slug}),
+        reverse("page-metadata", kwargs={"page": slug}),
+    ]
+
+
+class Comic(LoadedValuesMixin, models.Model):
     # Routing information
     domain = models.CharField(
         max_length=128, unique=True, blank=True,
@@ -48,6 +96,9 @@ class Comic(models.Model):
 
     # Misc configuration
     quests_tab_title = models.CharField(max_length=16, default="Quests")
+    random_shuffle_bag = models.BooleanField(
+        default=False, help_text="If True, the random page redirect won't repeat a page for a reader until they have "
+                                 "seen every page.")
 
     # Third-party integrations
     discourse_url = models.URLField(
@@ -73,9 +124,15 @@ class Comic(models.Model):
 
     @staticmethod
     def clear_cache(sender, instance, **kwargs):
-        purge_paths(instance, [], everything=True)
+        clear_comic_cache(instance)
+        # Every page's image URLs change with this
+        if instance.cloudflare_resize != instance.loaded_value('cloudflare_resize'):
+            static_data.schedule_update(instance)
 
 
+# The routing table moves on first, so a response rendered with the old comic is never cached under the new generation
+post_save.connect(routing.invalidate, Comic)
+post_delete.connect(routing.invalidate, Comic)
 post_save.connect(Comic.clear_cache, Comic)
 
 
@@ -100,6 +157,14 @@ class HeaderLink(models.Model):
     def __str__(self):
         return f"{self.comic} - {self.text}"
 
+    @staticmethod
+    def clear_cache(sender, instance, **kwargs):
+        Comic.clear_cache(sender, instance.comic, **kwargs)
+
+
+post_save.connect(HeaderLink.clear_cache, HeaderLink)
+post_delete.connect(HeaderLink.clear_cache, HeaderLink)
+
 
 class ShortCodeRedirect(models.Model):
     """Short URLs for redirecting to other places. For example, https://comic.example.com/patreon -> your Patreon URL"""
@@ -115,8 +180,26 @@ class SnippetQuerySet(models.QuerySet):
             active=True
         )
 
+    def by_location(self, comic, testing):
+        """The joined code of every active snippet for this comic, as a dict keyed by location. Cached per comic."""
+        key = _snippet_cache_key(comic.id if comic else None, testing)
+        snippets = cache.get(key)
+        if snippets is None:
+            snippets = {}
+            with database.primary_reads():
+                rows = list(self.for_comic(comic).filter(testing=testing).values_list('location', 'code'))
+            for location, code in rows:
+                snippets.setdefault(location, []).append(code)
+            snippets = {location: "\n".join(codes) for location, codes in snippets.items()}
+            cache.set(key, snippets, None)
+        return snippets
+
+
+def _snippet_cache_key(comic_id, testing):
+    return f"comics:{comic_id or 'global'}:snippets:{int(testing)}"
 
-class CodeSnippet(models.Model):
+
+class CodeSnippet(LoadedValuesMixin, models.Model):
     """Arbitrary HTML code that gets injected into the main comics pages."""
 
     name = models.CharField(
@@ -145,10 +228,21 @@ class CodeSnippet(models.Model):
 
     @staticmethod
     def clear_cache(sender, instance, **kwargs):
-        Comic.clear_cache(sender, instance.comic, **kwargs)
+        # Global snippets are injected into every comic, and into pages that aren't on a comic's domain. A snippet
+        # that moved is cleared from where it was shown before, too.
+        comic_ids = {instance.comic_id, instance.loaded_value('comic_id')}
+        if None in comic_ids:
+            comics = Comic.objects.all()
+            comic_ids |= {c.id for c in comics}
+        else:
+            comics = Comic.objects.filter(pk__in=comic_ids)
+        cache.delete_many([_snippet_cache_key(i, testing) for i in comic_ids for testing in (False, True)])
+        for comic in comics:
+            Comic.clear_cache(sender, comic, **kwargs)
 
 
 post_save.connect(CodeSnippet.clear_cache, CodeSnippet)
+post_delete.connect(CodeSnippet.clear_cache, CodeSnippet)
 
 
 class CssPropertyChoices(models.TextChoices):
@@ -182,8 +276,39 @@ class StyleConfiguration(models.Model):
     class Meta:
         unique_together = (('comic', 'property'),)
 
+    @staticmethod
+    def clear_cache(sender, instance, **kwargs):
+        Comic.clear_cache(sender, instance.comic, **kwargs)
+
 
-class TagType(models.Model):
+post_save.connect(StyleConfiguration.clear_cache, StyleConfiguration)
+post_delete.connect(StyleConfiguration.clear_cache, StyleConfiguration)
+
+
+class TagTypeQuerySet(models.QuerySet):
+    def summaries(self, comic):
+        """The title, URL, tag count and best icon of each of the comic's tag types, for the archive index. Cached."""
+        key = caching.comic_key(comic.id, "tag-type-summaries")
+        summaries = cache.get(key)
+        if summaries is None:
+            with database.primary_reads():
+                tag_types = list(self.filter(comic=comic))
+                # The tags come out most used first, so the first one seen for a type has its best icon
+                tags = list(Tag.objects.filter(type__comic=comic).select_related('type').annotate(
+                    count=models.Count('pages')).order_by('type', '-count', 'title'))
+            summaries = {t.id: {"title": t.title, "url": t.get_absolute_url(), "count": 0, "icon": None}
+                         for t in tag_types}
+            for tag in tags:
+                summary = summaries[tag.type_id]
+                if summary["count"] == 0:
+                    summary["icon"] = tag.icon_url
+                summary["count"] += 1
+            summaries = sorted(summaries.values(), key=lambda s: s["title"])
+            cache.set(key, summaries, caching.RESPONSE_CACHE_TIMEOUT)
+        return summaries
+
+
+class TagType(LoadedValuesMixin, models.Model):
     comic = models.ForeignKey(Comic, on_delete=models.CASCADE, related_name="tag_types")
     title = models.CharField(max_length=16)  # TODO: Make sure this is URL-safe?
     default_icon = models.ImageField(blank=True, help_text="Tags without an image will use this instead.")
@@ -192,12 +317,18 @@ class TagType(models.Model):
         'comics.Ad', on_delete=models.SET_NULL, null=True, blank=True,
         help_text="If not blank, this ad will be shown on this tag page. HEADS UP! It will show even if deactivated!")
 
+    objects = TagTypeQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.title} ({self.comic})"
 
     class Meta:
         unique_together = (('comic', 'title'), )
         ordering = ('title', )
+        indexes = [
+            # Not per comic, so tag references in Markdown (which name a type, but not a comic) can use it too
+            models.Index(Lower('title'), name='comics_tagtype_lower_title_idx'),
+        ]
 
     def get_absolute_url(self):
         return reverse("archive-tagtype", kwargs={
@@ -209,15 +340,35 @@ class TagType(models.Model):
         most_used_tag = self.tags.annotate(count=models.Count('pages')).order_by("-count", 'title').first()
         return most_used_tag.icon_url
 
+    def get_purge_paths(self):
+        """The URLs whose content depends on this tag type."""
+        paths = {reverse("archive-index")}
+        tags = list(self.tags.all())
+        for title in {self.title, self.loaded_value('title')}:
+            paths.add(reverse("archive-tagtype", kwargs={"type": title}))
+            for tag in tags:
+                paths.add(reverse("archive-tag", kwargs={"type": title, "tag": tag.title}))
+        for slug in Page.objects.active().filter(tags__type=self).values_list('slug', flat=True).distinct():
+            paths.update(page_paths(slug))
+        return paths
+
     @staticmethod
     def clear_cache(sender, instance, **kwargs):
-        Comic.clear_cache(sender, instance.comic, **kwargs)
+        if kwargs.get('signal') is post_delete:
+            # The pages that showed its tags can't be looked up any more, so rewrite them all
+            Comic.clear_cache(sender, instance.comic, **kwargs)
+            static_data.schedule_update(instance.comic)
+        else:
+            clear_comic_cache(instance.comic, instance.get_purge_paths())
 
 
 post_save.connect(TagType.clear_cache, TagType)
+post_delete.connect(TagType.clear_cache, TagType)
+post_save.connect(custom_markdown.clear_render_cache, TagType)
+post_delete.connect(custom_markdown.clear_render_cache, TagType)
 
 
-class Tag(models.Model):
+class Tag(LoadedValuesMixin, models.Model):
     icon = models.ImageField(
         blank=True, null=True, help_text="This image needs to be a 1:1 aspect ratio.")  # TODO: Recommended pixel size
     title = models.CharField(max_length=32)  # TODO: Make sure this is URL-safe?
@@ -234,6 +385,9 @@ class Tag(models.Model):
     class Meta:
         unique_together = (('type', 'title'), )
         ordering = ('type', 'title', )
+        indexes = [
+            models.Index(F('type'), Lower('title'), name='comics_tag_lower_title_idx'),
+        ]
 
     @property
     def icon_url(self):
@@ -254,12 +408,44 @@ class Tag(models.Model):
             "tag": self.title,
         })
 
+    def get_purge_paths(self):
+        """The URLs whose content depends on this tag: its archive pages and every page it appears on."""
+        paths = {reverse("archive-index")}
+        types = {self.type}
+        if self.loaded_value('type_id') != self.type_id:
+            types.add(TagType.objects.get(pk=self.loaded_value('type_id')))
+        for tag_type in types:
+            paths.add(tag_type.get_absolute_url())
+            for title in {self.title, self.loaded_value('title')}:
+                paths.add(reverse("archive-tag", kwargs={"type": tag_type.title, "tag": title}))
+        for slug in self.pages.active().values_list('slug', flat=True):
+            paths.update(page_paths(slug))
+        return paths
+
     @staticmethod
     def clear_cache(sender, instance, **kwargs):
-        Comic.clear_cache(sender, instance.type.comic, **kwargs)
+        if kwargs.get('signal') is post_delete:
+            # The pages that showed this tag can't be looked up any more, so rewrite them all
+            Comic.clear_cache(sender, instance.type.comic, **kwargs)
+            static_data.schedule_update(instance.type.comic)
+        else:
+            clear_comic_cache(instance.type.comic, instance.get_purge_paths())
 
 
 post_save.connect(Tag.clear_cache, Tag)
+post_delete.connect(Tag.clear_cache, Tag)
+post_save.connect(custom_markdown.clear_render_cache, Tag)
+post_delete.connect(custom_markdown.clear_render_cache, Tag)
+
+
+def group_tags(tags):
+    """Group tags (annotated with their page `count`) by type, then sort by popularity and title, as plain data."""
+    tags = sorted(tags, key=lambda t: (t.type.title, -t.count, t.title))
+    return [{"title": tag_type.title, "tags": [{
+        "url": tag.get_absolute_url(),
+        "title": tag.title,
+        "icon": tag.icon_url or "",
+    } for tag in group]} for tag_type, group in itertools.groupby(tags, lambda t: t.type)]
 
 
 class PageQuerySet(models.QuerySet):
@@ -267,7 +453,7 @@ class PageQuerySet(models.QuerySet):
         return self.filter(posted_at__lte=now())
 
 
-class Page(models.Model):
+class Page(LoadedValuesMixin, models.Model):
     def get_image_file_path(self, filename):
         return f"{self.comic.title}/images/{filename}"
 
@@ -289,7 +475,9 @@ class Page(models.Model):
     transcript = models.TextField(blank=True, help_text="Accepts Markdown")
     image = models.ImageField(upload_to=get_image_file_path)
     thumbnail = models.ImageField(upload_to=get_thumbnail_file_path, null=True, blank=True,
-                                  help_text="Recommended size: 300x300px")
+                                  help_text="Recommended size: 300x300px. Leave blank to generate one from the image.")
+    image_width = models.PositiveIntegerField(
+        null=True, blank=True, editable=False, help_text="Set once the resized copies of the image have been made.")
     alt_text = models.CharField(max_length=150, blank=True)
     tags = models.ManyToManyField(Tag, blank=True, related_name="pages")
 
@@ -298,13 +486,35 @@ class Page(models.Model):
     class Meta:
         unique_together = (("comic", "slug"), ("comic", "ordering"), )
         ordering = ('ordering', )
+        indexes = [
+            # A comic's published pages in order. Queries for only these columns never read the table itself.
+            models.Index(fields=['comic', 'ordering', 'posted_at'], name='comics_page_reader_idx'),
+            models.Index(F('comic'), Lower('slug'), name='comics_page_lower_slug_idx'),
+        ]
 
     @property
     def resized_image_url(self):
         if self.comic.cloudflare_resize:
             return build_resize_url(self.image.url, 1440)  # 1440 is a size that works on virtually all screens
+        widths = images.rendition_widths(self.image_width or 0)
+        if widths:
+            return images.rendition_url(self.image.name, widths[-1], "jpg")
         return self.image.url
 
+    @property
+    def image_srcset(self):
+        return images.build_srcset(self, "jpg")
+
+    @property
+    def image_webp_srcset(self):
+        return images.build_srcset(self, "webp")
+
+    @property
+    def small_thumbnail_url(self):
+        if self.thumbnail and self.image_width:
+            return images.rendition_url(self.thumbnail.name, images.SMALL_THUMBNAIL_SIZE, "webp")
+        return None
+
     def get_absolute_url(self):
         return reverse("reader", kwargs={
             "page": self.slug,
@@ -325,12 +535,155 @@ class Page(models.Model):
     def transcript_txt(self):
         return custom_markdown.render_txt(self.transcript)
 
+    @property
+    def tag_groups(self):
+        """The page's tags grouped by type, then by popularity and title, as plain data for the reader. Cached."""
+        key = caching.comic_key(self.comic_id, "page", self.id, "tag-groups")
+        groups = cache.get(key)
+        if groups is None:
+            with database.primary_reads():
+                groups = group_tags(self.tags.select_related('type').annotate(count=models.Count('pages')))
+            cache.set(key, groups, caching.RESPONSE_CACHE_TIMEOUT)
+        return groups
+
+    def get_purge_paths(self):
+        """The URLs whose content depends on this page, or None if every page of the comic is affected."""
+        current_time = now()
+        slugs = {self.slug, self.loaded_value('slug')}
+        paths = set()
+        for slug in slugs:
+            paths.update(page_paths(slug))
+        if self.posted_at > current_time and self.loaded_value('posted_at') > current_time:
+            # Nobody can see this page yet, so nothing else links to it
+            return paths
+
+        # Every page links to the first and last pages, so moving those around touches the whole comic. The change
+        # isn't committed yet, so this index mustn't be shared with other requests.
+        index = navigation.build_index(self.comic)
+        orderings = {self.ordering, self.loaded_value('ordering')}
+        if not index or any(o <= index.first.ordering or o >= index.last.ordering for o in orderings):
+            return None
+
+        # The neighbours on both sides of the old and new positions link here with their previous/next buttons
+        for ordering in orderings:
+            for neighbour in (index.previous(ordering), index.next(ordering)):
+                if neighbour:
+                    paths.update(page_paths(neighbour.slug))
+
+        paths.update([reverse("comic-metadata"), reverse("archive-index"), reverse("archive-pages")])
+        if len(index) <= 10 or max(orderings) >= index.entries[-10].ordering:
+            paths.update([reverse("feed"), reverse("feed-alt")])
+        for tag in self.tags.select_related('type'):
+            paths.update([tag.get_absolute_url(), tag.type.get_absolute_url()])
+        return paths
+
     @staticmethod
-    def clear_cache(sender, instance, **kwargs):
-        Comic.clear_cache(sender, instance.comic, **kwargs)
+    def build_images(sender, instance, **kwargs):
+        """Queue new images (and thumbnails) to be resized by the image worker."""
+        if (instance.image_width is not None and
+                instance.image.name == str(instance.loaded_value('image')) and
+                instance.thumbnail.name == str(instance.loaded_value('thumbnail') or "")):
+            return
+        # The old resized copies are named after the old image, so fall back to the original until the new ones exist
+        instance.image_width = None
+        Page.objects.filter(pk=instance.pk).update(image_width=None)
+        ImageJob.objects.enqueue(instance)
 
+    @staticmethod
+    def clear_cache(sender, instance, **kwargs):
+        navigation.clear_navigation_index(instance.comic)
+        paths = None if kwargs.get('signal') is post_delete else instance.get_purge_paths()
+        clear_comic_cache(instance.comic, paths)
 
+    @staticmethod
+    def clear_tags_cache(sender, instance, action, pk_set, **kwargs):
+        """Purge the pages and tags on both ends of a change to `Page.tags`."""
+        if action not in ("post_add", "post_remove", "post_clear"):
+            return
+        if kwargs['reverse']:
+            comic, tags, pages = instance.type.comic, [instance], Page.objects.filter(pk__in=pk_set or [])
+        else:
+            comic, pages, tags = instance.comic, [instance], Tag.objects.filter(pk__in=pk_set or [])
+        if pk_set is None:
+            # A clear() doesn't tell us what was removed
+            Comic.clear_cache(sender, comic, **kwargs)
+            static_data.schedule_update(comic)
+            return
+
+        paths = set()
+        for page in pages:
+            paths.update(page_paths(page.slug))
+        for tag in tags:
+            paths.update([tag.get_absolute_url(), tag.type.get_absolute_url()])
+        clear_comic_cache(comic, paths)
+
+
+post_save.connect(Page.build_images, Page)
 post_save.connect(Page.clear_cache, Page)
+post_delete.connect(Page.clear_cache, Page)
+m2m_changed.connect(Page.clear_tags_cache, Page.tags.through)
+
+
+class ImageJobQuerySet(models.QuerySet):
+    def enqueue(self, page):
+        """(Re)queue the page's images to be resized, as soon as possible."""
+        self.update_or_create(page=page, defaults={
+            "status": ImageJob.PENDING, "attempts": 0, "run_after": now(), "error": "",
+        })
+
+    def claim(self, limit):
+        """Mark up to `limit` jobs that are due as running, and return them. Safe against other workers claiming the
+        same jobs."""
+        claimed = []
+        due = self.filter(status=ImageJob.PENDING, run_after__lte=now()).order_by('run_after')
+        for job in due[:limit]:
+            if self.filter(pk=job.pk, status=ImageJob.PENDING).update(
+                    status=ImageJob.RUNNING, attempts=models.F('attempts') + 1):
+                job.status, job.attempts = ImageJob.RUNNING, job.attempts + 1
+                claimed.append(job)
+        return claimed
+
+
+class ImageJob(models.Model):
+    """Resizing a Page's image happens in the background, worked through by `./manage.py image_worker`."""
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUSES = (
+        (PENDING, "Pending"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    )
+
+    # Failed jobs are retried after 30s, 1m, 2m and 4m before giving up
+    MAX_ATTEMPTS = 5
+    RETRY_DELAY = 30
+
+    page = models.OneToOneField(Page, on_delete=models.CASCADE, related_name="image_job")
+    status = models.CharField(max_length=8, choices=STATUSES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    run_after = models.DateTimeField(default=now, help_text="The job won't be started before this time.")
+    error = models.TextField(blank=True, help_text="Why the last attempt failed.")
+    changed_at = models.DateTimeField(auto_now=True)
+
+    objects = ImageJobQuerySet.as_manager()
+
+    def __str__(self):
+        return f"{self.page} ({self.get_status_display()})"
+
+    def finish(self):
+        # If the page was saved again while this ran, it's been queued again, so leave it alone
+        ImageJob.objects.filter(pk=self.pk, status=ImageJob.RUNNING).update(status=ImageJob.DONE, error="")
+
+    def fail(self, error):
+        if self.attempts < self.MAX_ATTEMPTS:
+            status, run_after = ImageJob.PENDING, now() + timedelta(seconds=self.RETRY_DELAY * 2 ** (self.attempts - 1))
+        else:
+            status, run_after = ImageJob.FAILED, now()
+        ImageJob.objects.filter(pk=self.pk, status=ImageJob.RUNNING).update(
+            status=status, run_after=run_after, error=str(error))
 
 
 class Chapter(models.Model):
@@ -352,20 +705,42 @@ class Chapter(models.Model):
 
     @staticmethod
     def clear_cache(sender, instance, **kwargs):
-        purge_paths(instance.comic, [
+        clear_comic_cache(instance.comic, [
             reverse("archive-pages"),
         ])
 
 
 post_save.connect(Chapter.clear_cache, Chapter)
+post_delete.connect(Chapter.clear_cache, Chapter)
 
 
 class AdQuerySet(models.QuerySet):
     def active(self, comic):
-        return self.filter(comic=comic, active=True).order_by("?").first()
+        return self.filter(comic=comic, active=True)
+
+    def pool(self, comic, type):
+        """Every active ad of this type that can be shown on the comic. Cached per comic."""
+        key = _ad_cache_key(comic.id, type)
+        ads = cache.get(key)
+        if ads is None:
+            with database.primary_reads():
+                ads = list(self.active(comic).filter(type=type, weight__gt=0))
+            cache.set(key, ads, None)
+        return ads
+
+    def pick(self, comic, type):
+        """Randomly choose one ad from the pool, favoring ads with a larger weight."""
+        ads = self.pool(comic, type)
+        if not ads:
+            return None
+        return random.choices(ads, weights=[ad.weight for ad in ads])[0]
 
 
-class Ad(models.Model):
+def _ad_cache_key(comic_id, type):
+    return f"comics:{comic_id}:ads:{type}"
+
+
+class Ad(LoadedValuesMixin, models.Model):
     """Ad objects show a custom banner at the bottom of the comic."""
     AD_TYPES = [
         ('Banner', 'Banner'),
@@ -378,6 +753,9 @@ class Ad(models.Model):
     url = models.URLField()
     active = models.BooleanField(
         default=True, help_text="The ad shown on the page is randomly chosen from all active ads.")
+    weight = models.PositiveSmallIntegerField(
+        default=1, help_text="How often this ad is chosen compared to the others. An ad with a weight of 2 is shown "
+                             "twice as often as one with a weight of 1. Zero means it is never shown.")
 
     objects = AdQuerySet.as_manager()
 
@@ -386,10 +764,13 @@ class Ad(models.Model):
 
     @staticmethod
     def clear_cache(sender, instance, **kwargs):
+        comic_ids = {instance.comic_id, instance.loaded_value('comic_id')}
+        cache.delete_many([_ad_cache_key(i, t) for i in comic_ids for t, _ in Ad.AD_TYPES])
         Comic.clear_cache(sender, instance.comic, **kwargs)
 
 
 post_save.connect(Ad.clear_cache, Ad)
+post_delete.connect(Ad.clear_cache, Ad)
 
 
 class AliasUrl(models.Model):
@@ -409,6 +790,10 @@ class AliasUrl(models.Model):
         super().clean()
 
 
+post_save.connect(routing.invalidate, AliasUrl)
+post_delete.connect(routing.invalidate, AliasUrl)
+
+
 def social_icon_static_path(instance, filename):
     return f'social_icons/{instance.name}/{filename}'
 
@@ -437,6 +822,14 @@ class SocialPlatform(models.Model):
     def __str__(self):
         return self.name
 
+    @staticmethod
+    def clear_cache(sender, instance, **kwargs):
+        for link in instance.linkedsocialplatform_set.select_related('comic'):
+            Comic.clear_cache(sender, link.comic, **kwargs)
+
+
+post_save.connect(SocialPlatform.clear_cache, SocialPlatform)
+
 
 class LinkedSocialPlatform(models.Model):
     comic = models.ForeignKey(Comic, on_delete=models.CASCADE, related_name='social_links')
@@ -465,3 +858,11 @@ class LinkedSocialPlatform(models.Model):
 
     def __str__(self):
         return f"{self.comic} - {self.platform}"
+
+    @staticmethod
+    def clear_cache(sender, instance, **kwargs):
+        Comic.clear_cache(sender, instance.comic, **kwargs)
+
+
+post_save.connect(LinkedSocialPlatform.clear_cache, LinkedSocialPlatform)
+post_delete.connect(LinkedSocialPlatform.clear_cache, LinkedSocialPlatform)
@@ -0,0 +1,104 @@
+import bisect
+import time
+from collections import namedtuple
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.timezone import now
+
+from apps.comics import database
+
+NavigationEntry = namedtuple("NavigationEntry", ("ordering", "slug", "posted_at"))
+
+
+class NavigationIndex:
+    """A sorted list of a comic's active pages, used to answer first/previous/next/last without hitting the database.
+
+    The index is only valid until `expires_at`, the moment the next scheduled page goes live (or None if nothing is
+    scheduled).
+    """
+    def __init__(self, entries, expires_at=None):
+        self.entries = entries
+        self.orderings = [e.ordering for e in entries]
+        self.expires_at = expires_at
+
+    def __len__(self):
+        return len(self.entries)
+
+    @property
+    def first(self):
+        return self.entries[0] if self.entries else None
+
+    @property
+    def last(self):
+        return self.entries[-1] if self.entries else None
+
+    def previous(self, ordering):
+        i = bisect.bisect_left(self.orderings, ordering)
+        return self.entries[i - 1] if i > 0 else None
+
+    def next(self, ordering):
+        i = bisect.bisect_right(self.orderings, ordering)
+        return self.entries[i] if i < len(self.entries) else None
+
+    def around(self, slug, radius):
+        """The entry for `slug` with up to `radius` entries on either side, or an empty list if it isn't published."""
+        for i, entry in enumerate(self.entries):
+            if entry.slug == slug:
+                return self.entries[max(0, i - radius):i + radius + 1]
+        return []
+
+    @property
+    def published_at(self):
+        """When the most recently published page went live."""
+        return max((e.posted_at for e in self.entries), default=None)
+
+    def is_expired(self):
+        return self.expires_at is not None and self.expires_at <= now()
+
+
+def _cache_key(comic_id):
+    return f"comics:{comic_id}:navigation:index"
+
+
+def _version_key(comic_id):
+    return f"comics:{comic_id}:navigation:version"
+
+
+def build_index(comic):
+    """Build the comic's index from the database, without caching it."""
+    current_time = now()
+    with database.primary_reads():
+        rows = list(comic.pages.order_by('ordering').values_list('ordering', 'slug', 'posted_at'))
+    entries = [NavigationEntry(*row) for row in rows if row[2] <= current_time]
+    expires_at = min((row[2] for row in rows if row[2] > current_time), default=None)
+    return NavigationIndex(entries, expires_at)
+
+
+def get_navigation_index(comic):
+    # The index is stored with the version it was built under. One built from rows read before a change was committed
+    # has the old version, so it's never used once `clear_navigation_index` has moved the version on.
+    version_key, key = _version_key(comic.id), _cache_key(comic.id)
+    cached = cache.get_many([version_key, key])
+    version = cached.get(version_key)
+    if version is None:
+        version = time.time_ns()
+        if not cache.add(version_key, version, None):
+            version = cache.get(version_key, version)
+
+    built_under, index = cached.get(key, (None, None))
+    if index is None or built_under != version or index.is_expired():
+        index = build_index(comic)
+        timeout = None
+        if index.expires_at is not None:
+            timeout = max(1, int((index.expires_at - now()).total_seconds()) + 1)
+        cache.set(key, (version, index), timeout)
+    return index
+
+
+def clear_navigation_index(comic):
+    """Make every worker rebuild the comic's index, once the current transaction commits."""
+    def run():
+        cache.set(_version_key(comic.id), time.time_ns(), None)
+        cache.delete(_cache_key(comic.id))
+    transaction.on_commit(run)
@@ -0,0 +1,86 @@
+import copy
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+from apps.comics import database
+
+# Each worker process keeps its own copy of the table, valid for as long as the version in the shared cache doesn't
+# change. Saves and deletes move the version on once they're committed, so every worker rebuilds its copy on its next
+# request. Without a shared cache, copies are rebuilt once they're older than this many seconds instead.
+ROUTING_TABLE_TTL = 60
+VERSION_KEY = "comics:routing:version"
+
+_lock = threading.Lock()
+_table = None
+_version = None
+_built_at = 0.0
+
+
+def _build_table():
+    """Map every canonical and alias domain to a `(comic, is_alias)` pair."""
+    from apps.comics.models import Comic, AliasUrl
+
+    table = {}
+    with database.primary_reads():
+        for comic in Comic.objects.exclude(domain=""):
+            table[comic.domain] = (comic, False)
+        for alias in AliasUrl.objects.select_related("comic"):
+            table[alias.domain] = (alias.comic, True)
+    return table
+
+
+def get_version():
+    """The version of the routing table every worker should be using."""
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, time.time_ns(), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def _get_table():
+    global _table, _version, _built_at
+    # Read the version first: a change committed while the table is built only makes the table newer than it
+    version = get_version()
+    table = _table
+    if table is None or _version != version or time.monotonic() - _built_at > ROUTING_TABLE_TTL:
+        with _lock:
+            table = _build_table()
+            _table, _version, _built_at = table, version, time.monotonic()
+    return table, version
+
+
+def get_routing_table():
+    return _get_table()[0]
+
+
+def resolve(host):
+    """Find the comic served on `host`. Returns `(comic, is_alias)`, or `(None, False)` if nothing is configured there.
+
+    The comic is a shallow copy so that per-request changes to it can't leak into other requests.
+    """
+    table, version = _get_table()
+    comic, is_alias = table.get(host, (None, False))
+    if comic is not None:
+        comic = copy.copy(comic)
+        comic._routing_version = version
+    return comic, is_alias
+
+
+def is_stale(comic):
+    """Whether `comic` came from a routing table that's been replaced since, so it may not match the database."""
+    version = getattr(comic, "_routing_version", None)
+    return version is not None and version != get_version()
+
+
+def invalidate(*args, **kwargs):
+    """Make every worker rebuild its routing table, once the change is committed. Accepts (and ignores) signal
+    arguments so it can be used as a receiver."""
+    def run():
+        global _table
+        _table = None
+        cache.set(VERSION_KEY, time.time_ns(), None)
+    transaction.on_commit(run)
@@ -0,0 +1,311 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Count
+from django.template.defaultfilters import date
+from django.urls import resolve, reverse, Resolver404
+from django.utils.timezone import now
+
+from apps.comics import navigation
+from apps.comics.cloudflare_utilities import purge_paths
+
+logger = logging.getLogger(__name__)
+
+# How long old page lists are remembered, so that returning readers can catch up with a small delta
+PAGE_LIST_TIMEOUT = 60 * 60 * 24 * 30
+
+
+def _name(comic, *parts):
+    return "/".join((comic.title, "data") + parts)
+
+
+def _comic_name(comic):
+    return _name(comic, "comic.json")
+
+
+def _page_name(comic, slug):
+    return _name(comic, "pages", f"{slug}.json")
+
+
+def get_url(comic):
+    """The URL the comic's static data is served under, with a trailing slash."""
+    return default_storage.url(_name(comic, ""))
+
+
+def _page_list_key(comic_id, version):
+    return f"comics:{comic_id}:page-list:{version}"
+
+
+def get_page_list_version(comic, slugs):
+    """A short version string for this list of published slugs. The list is remembered for a while under it, so
+    readers holding an older version can be sent just what changed since."""
+    version = hashlib.sha1("\n".join(slugs).encode()).hexdigest()[:12]
+    cache.add(_page_list_key(comic.id, version), slugs, PAGE_LIST_TIMEOUT)
+    return version
+
+
+def build_ad_data(comic):
+    """Every ad that can be shown on the comic, by type. Pages pick their own ads from these with
+    `rotateInvitations`, so the cached HTML doesn't show the same ad to everyone."""
+    from apps.comics.models import Ad
+
+    return {ad_type: [{
+        "image": ad.image.url,
+        "url": ad.url,
+        "weight": ad.weight,
+    } for ad in Ad.objects.pool(comic, ad_type)] for ad_type, _ in Ad.AD_TYPES}
+
+
+def build_comic_data(comic, index=None, since=None):
+    """The payload of the `comic-metadata` endpoint.
+
+    It lists every published slug under `pages`, unless `since` is a page list version that's still remembered. Then
+    it lists only the slugs `added` and `removed` since that version instead.
+    """
+    if index is None:
+        index = navigation.get_navigation_index(comic)
+    slugs = [e.slug for e in index.entries]
+    data = {
+        "socialLinks": [{
+            "title": s.title or s.platform.name,
+            "image": s.platform.image.url if s.platform.image else "",
+            "visitUrl": s.visit_url,
+            "followUrl": s.follow_url or s.visit_url,
+            "shareUrlTemplate": s.platform.share_template,
+            "visitCta": s.visit_cta or s.platform.visit_cta,
+            "followCta": s.follow_cta or s.platform.follow_cta,
+            "shareCta": s.share_cta or s.platform.share_cta,
+            "requiresMoney": s.platform.requires_money,
+        } for s in comic.social_links.select_related('platform')],
+        "version": get_page_list_version(comic, slugs),
+        "ads": build_ad_data(comic),
+    }
+
+    previous = cache.get(_page_list_key(comic.id, since)) if since else None
+    if previous is None:
+        data["pages"] = slugs
+    else:
+        current, known = set(slugs), set(previous)
+        data["added"] = [slug for slug in slugs if slug not in known]
+        data["removed"] = [slug for slug in previous if slug not in current]
+    return data
+
+
+def build_page_data(page, index=None, tag_groups=None):
+    """The payload of the `page-metadata` endpoint."""
+    if index is None:
+        index = navigation.get_navigation_index(page.comic)
+    if tag_groups is None:
+        tag_groups = page.tag_groups
+    first, previous, next, last = (
+        index.first, index.previous(page.ordering), index.next(page.ordering), index.last)
+    return {
+        "slug": page.slug,
+        "title": page.title,
+        "post": page.post_html,
+        "posted_at": date(page.posted_at),
+        "transcript": page.transcript_html,
+        "image": page.resized_image_url,
+        "image_srcset": page.image_srcset,
+        "image_webp_srcset": page.image_webp_srcset,
+        "alt_text": page.alt_text,
+        "tag_types": tag_groups,
+
+        # Get the comic list
+        "first": first.slug if first else None,
+        "previous": previous.slug if previous else None,
+        "next": next.slug if next else None,
+        "last": last.slug if last else None,
+
+        # Admin edit link for those who have access
+        "admin": reverse("admin:comics_page_change", args=[page.id]),
+    }
+
+
+def get_tag_groups(pages):
+    """`Page.tag_groups` for every page in the queryset, from two queries."""
+    from apps.comics.models import Page, Tag, group_tags
+
+    links = list(Page.tags.through.objects.filter(page__in=pages).values_list('page_id', 'tag_id'))
+    tags = Tag.objects.filter(pk__in={tag_id for _, tag_id in links}).select_related('type').annotate(
+        count=Count('pages'))
+    tags = {tag.id: tag for tag in tags}
+    tags_by_page = {}
+    for page_id, tag_id in links:
+        tags_by_page.setdefault(page_id, []).append(tags[tag_id])
+    return {page_id: group_tags(page_tags) for page_id, page_tags in tags_by_page.items()}
+
+
+def build_window_data(comic, slug, radius):
+    """The `page-metadata` payloads of the page `slug` and up to `radius` published pages either side of it, in order.
+    Returns None if the page isn't published."""
+    index = navigation.get_navigation_index(comic)
+    slugs = [e.slug for e in index.around(slug, radius)]
+    if not slugs:
+        return None
+
+    pages = comic.pages.filter(slug__in=slugs)
+    tag_groups = get_tag_groups(pages)
+    pages = {page.slug: page for page in pages}
+    data = []
+    for slug in slugs:
+        # The index is built from the primary database, and a replica may not have every page in it yet
+        page = pages.get(slug)
+        if page is None:
+            continue
+        page.comic = comic
+        data.append(build_page_data(page, index, tag_groups.get(page.id, [])))
+    return {"pages": data}
+
+
+def _get_links(slugs):
+    """The first/previous/next/last slugs each page links to."""
+    first, last = (slugs[0], slugs[-1]) if slugs else (None, None)
+    return {
+        slug: (first, slugs[i - 1] if i > 0 else None, slugs[i + 1] if i + 1 < len(slugs) else None, last)
+        for i, slug in enumerate(slugs)
+    }
+
+
+def _read_exported_slugs(comic):
+    try:
+        with default_storage.open(_comic_name(comic)) as f:
+            return json.load(f)["pages"]
+    except (OSError, ValueError, KeyError):
+        return []
+
+
+def _write(files, removed):
+    """Write every `(name, data)` pair to a temporary file beside its destination, then move them all into place and
+    delete the `removed` names. Readers never see a half-written file, and neighbouring pages change together."""
+    written = []
+    try:
+        for name, data in files:
+            path = default_storage.path(name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, temporary = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            written.append((temporary, path))
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f)
+            os.chmod(temporary, 0o644)
+    except BaseException:
+        for temporary, _ in written:
+            os.remove(temporary)
+        raise
+
+    for temporary, path in written:
+        os.replace(temporary, path)
+    for name in removed:
+        default_storage.delete(name)
+
+
+def update(comic, slugs=None):
+    """Rewrite the static data of the pages in `slugs` (or of every page, if None) and of the comic.
+
+    Pages whose first/previous/next/last links have moved since the last export are rewritten too, and pages that are
+    no longer published are removed. Returns the URLs of every file that changed.
+    """
+    index = navigation.get_navigation_index(comic)
+    published = [e.slug for e in index.entries]
+    exported = _read_exported_slugs(comic)
+
+    if slugs is None or not exported:
+        pages = comic.pages.active()
+    else:
+        old_links, new_links = _get_links(exported), _get_links(published)
+        stale = [slug for slug in published if slug in slugs or old_links.get(slug) != new_links[slug]]
+        pages = comic.pages.active().filter(slug__in=stale)
+    removed = [_page_name(comic, slug) for slug in set(exported) - set(published)]
+
+    tag_groups = get_tag_groups(pages)
+    files = []
+    for page in pages:
+        page.comic = comic
+        files.append((_page_name(comic, page.slug), build_page_data(page, index, tag_groups.get(page.id, []))))
+    # The comic's file lists the pages that have been exported, so it goes last
+    files.append((_comic_name(comic), build_comic_data(comic, index)))
+
+    _write(files, removed)
+    # Every page links to the last one, so everything has to be rewritten when the next scheduled page goes live
+    cache.set(_expires_key(comic.id), index.expires_at, None)
+    return [default_storage.url(name) for name, _ in files] + [default_storage.url(name) for name in removed]
+
+
+def _rebuild_key(comic_id):
+    return f"comics:{comic_id}:static-data:rebuild"
+
+
+def _expires_key(comic_id):
+    return f"comics:{comic_id}:static-data:expires"
+
+
+def _update_and_purge(comic, slugs=None):
+    try:
+        urls = update(comic, slugs)
+    except OSError:
+        logger.exception("Couldn't write the static data of %s", comic)
+        return
+    purge_paths(comic, urls)
+
+
+def schedule_update(comic, slugs=None):
+    """Once the current transaction commits, rewrite the static data of the pages in `slugs`, of the comic, and of
+    the pages whose links moved, if the static data export is turned on.
+
+    Rewriting every page takes too long for a request, so that's left to `rebuild_requested`, which the image worker
+    runs. That's when `slugs` is None, nothing was exported yet, or the first or last page changed (every page links
+    to those).
+    """
+    if not settings.STATIC_PAGE_DATA:
+        return
+
+    def run():
+        exported = _read_exported_slugs(comic)
+        published = [e.slug for e in navigation.get_navigation_index(comic).entries]
+        if slugs is None or not exported or exported[:1] + exported[-1:] != published[:1] + published[-1:]:
+            cache.set(_rebuild_key(comic.id), time.time_ns(), None)
+        else:
+            _update_and_purge(comic, slugs)
+    transaction.on_commit(run)
+
+
+def rebuild_requested():
+    """Rewrite all the static data of every comic that `schedule_update` asked to be rebuilt, and of every comic with
+    a scheduled page that has gone live since its data was last written."""
+    from apps.comics.models import Comic
+
+    if not settings.STATIC_PAGE_DATA:
+        return
+    comics = list(Comic.objects.all())
+    requested = cache.get_many([key for comic in comics for key in (_rebuild_key(comic.id), _expires_key(comic.id))])
+    current_time = now()
+    for comic in comics:
+        requested_at = requested.get(_rebuild_key(comic.id))
+        expires_at = requested.get(_expires_key(comic.id))
+        if requested_at is None and (expires_at is None or expires_at > current_time):
+            continue
+        _update_and_purge(comic)
+        # Another rebuild asked for while this one ran needs a pass of its own
+        if cache.get(_rebuild_key(comic.id)) == requested_at:
+            cache.delete(_rebuild_key(comic.id))
+
+
+def page_slugs(paths):
+    """The slugs of the pages whose `page-metadata` URL is among `paths`."""
+    slugs = set()
+    for path in paths:
+        try:
+            match = resolve(path)
+        except Resolver404:
+            continue
+        if match.url_name == "page-metadata":
+            slugs.add(match.kwargs["page"])
+    return slugs
@@ -34,4 +34,67 @@ function sortResults(selectElement) {
     tiles.forEach(function (tile) {
         tile.parentNode.appendChild(tile);
     });
-}
\ No newline at end of file
+}
+
+function buildArchiveEntry(entry) {
+    if (entry.chapter !== undefined) {
+        var heading = document.createElement("h2");
+        heading.className = "archive-chapter-break";
+        heading.style.width = "100%";
+        heading.textContent = entry.chapter;
+        return heading;
+    }
+
+    var tile = document.createElement("a");
+    tile.className = "archive-tile";
+    tile.href = entry.url;
+    tile.dataset.title = entry.title;
+    if (entry.image) {
+        tile.style.backgroundImage = "url(" + JSON.stringify(entry.image) + ")";
+    }
+    if (entry.small_image) {
+        tile.style.backgroundImage = "image-set(url(" + JSON.stringify(entry.small_image) + ") 1x, url(" +
+            JSON.stringify(entry.image) + ") 2x)";
+    }
+    var title = document.createElement("strong");
+    title.textContent = entry.title;
+    var postedAt = document.createElement("small");
+    postedAt.textContent = entry.posted_at;
+    tile.append(title, postedAt);
+    return tile;
+}
+
+function loadRemainingPages(container) {
+    // The first chunk of pages is in the HTML, fetch the rest one chunk at a time
+    var next = container.dataset.next;
+    if (!next) {
+        return;
+    }
+    fetch(next).then(function (response) {
+        return response.json();
+    }).then(function (data) {
+        data.entries.forEach(function (entry) {
+            container.appendChild(buildArchiveEntry(entry));
+        });
+        var search = document.querySelector("input[type=search]");
+        if (search && search.value) {
+            filterResults(search);
+        }
+        if (data.next) {
+            container.dataset.next = data.next;
+        } else {
+            delete container.dataset.next;
+            document.querySelectorAll(".archive-more").forEach(function (more) {
+                more.remove();
+            });
+        }
+        loadRemainingPages(container);
+    });
+}
+
+document.addEventListener("DOMContentLoaded", function () {
+    var container = document.getElementById("archive-pages");
+    if (container) {
+        loadRemainingPages(container);
+    }
+});
@@ -29,6 +29,25 @@ function attemptToShowPopup() {
     sessionStorage.lastInvite = Date.now();
 }
 
+// Swap the server-rendered ads for a weighted random pick from `ads`, eg. the "ads" of the comic metadata
+function rotateInvitations(ads) {
+    const slots = {
+        "Banner": document.querySelector(".invitation"),
+        "Popup": document.querySelector(".dialog-invitation"),
+    };
+    for (const [type, element] of Object.entries(slots)) {
+        const choices = ads[type] || [];
+        if (element === null || choices.length === 0) {
+            continue;
+        }
+
+        let roll = Math.random() * choices.reduce((total, ad) => total + ad.weight, 0);
+        const ad = choices.find(ad => (roll -= ad.weight) < 0) || choices[choices.length - 1];
+        element.querySelector("a").href = ad.url;
+        element.querySelector("img").src = ad.image;
+    }
+}
+
 function closePopup(e) {
     e.classList.add("is-hidden");
     e.addEventListener(
@@ -44,5 +63,10 @@ function closePopup(e) {
 }
 
 document.addEventListener("DOMContentLoaded", function(event) {
+    // Pages that aren't the reader list the ads they can show, since they may have been cached with someone else's
+    const ads = document.getElementById("invitation-ads");
+    if (ads !== null) {
+        rotateInvitations(JSON.parse(ads.textContent));
+    }
     initializePopups();
 });
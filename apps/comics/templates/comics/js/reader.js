@@ -7,6 +7,8 @@ const COMICS = function () {
     const COMIC = {
         "title": "{{ comic.title }}",
         "pages": [],
+        // Static copies of the data endpoints, when the server publishes them
+        "dataUrl": "{{ static_data_url }}",
     };
     let NUM_ACTIVE_REQUESTS = 0;
 
@@ -47,6 +49,8 @@ const COMICS = function () {
         document.getElementById("comic-post").innerHTML = pageData.post;
         document.getElementById("comic-transcript").innerHTML = pageData.transcript;
         document.getElementById("comic-alt-text").innerHTML = pageData.alt_text;
+        document.getElementById("comic-image-webp").srcset = pageData.image_webp_srcset;
+        document.getElementById("comic-image").srcset = pageData.image_srcset;
         document.getElementById("comic-image").src = pageData.image;
         document.getElementById("comic-image").title = pageData.alt_text;
         setOpacity("#comic-image", 0.5);
@@ -117,10 +121,42 @@ const COMICS = function () {
         await preloadRandomComics();
     }
 
+    async function fetchData(staticPath, url) {
+        if (COMIC.dataUrl) {
+            const response = await fetch(COMIC.dataUrl + staticPath);
+            if (response.ok) {
+                return await response.json();
+            }
+        }
+        // Fall back to Django if there's no static copy (yet)
+        const response = await fetch(url);
+        return await response.json();
+    }
+
     async function preloadRandomComics() {
-        const response = await fetch("/comic/data/");
-        const data = await response.json();
-        COMIC.pages = data.pages;
+        // Keep the page list between visits, and only ask for what changed since
+        const stored = JSON.parse(localStorage.getItem("comic-pages") || "null");
+        let data;
+        if (stored !== null) {
+            const response = await fetch("/comic/data/?since=" + encodeURIComponent(stored.version));
+            data = await response.json();
+        } else {
+            data = await fetchData("comic.json", "/comic/data/");
+        }
+
+        let pages = data.pages;
+        if (pages === undefined) {
+            const removed = new Set(data.removed);
+            pages = stored.pages.filter(slug => !removed.has(slug)).concat(data.added);
+        }
+        try {
+            localStorage.setItem("comic-pages", JSON.stringify({"version": data.version, "pages": pages}));
+        } catch (e) {
+            // Storage is full or turned off, so we'll fetch the whole list again next time
+        }
+
+        COMIC.pages = pages;
+        rotateInvitations(data.ads);
     }
 
     async function navigateToPage(pageSlug, pushState = true) {
@@ -161,6 +197,13 @@ const COMICS = function () {
         // Try to show the popup
         window.setTimeout(attemptToShowPopup, 5000);
 
+        // Fetch a run of pages around this one in a single request, unless they're cheap static files anyway
+        const neighbours = [pageData.previous, pageData.next].filter(slug => slug !== null);
+        if (!COMIC.dataUrl && neighbours.some(slug => CACHE[slug] === undefined)) {
+            await requestPageWindow(pageData.slug);
+            neighbours.forEach(slug => preloadImage(CACHE[slug]));
+        }
+
         // Cache all the pages we can navigate to from this page
         await Promise.all([
             requestPageData(pageData.first),
@@ -220,8 +263,7 @@ const COMICS = function () {
         recalculateNavigationVisibility();
 
         // Execute the request
-        const response = await fetch("/comic/data/" + pageSlug + "/");
-        const data = await response.json()
+        const data = await fetchData("pages/" + pageSlug + ".json", "/comic/data/" + pageSlug + "/");
 
         // Run the callback and update the navigation state
         CACHE[pageSlug] = data;
@@ -231,18 +273,40 @@ const COMICS = function () {
         recalculateNavigationVisibility();
 
         // Pre-warm the image cache
-        preloadImage(data.image);
+        preloadImage(data);
 
         return data;
     }
 
-    function preloadImage(url) {
-        let img = new Image();
-        img.onload = function () {
-            img.src = "";
-            img = null;
-        }
-        img.src = url;
+    async function requestPageWindow(pageSlug) {
+        NUM_ACTIVE_REQUESTS += 1;
+        recalculateNavigationVisibility();
+
+        const response = await fetch("/comic/data/" + pageSlug + "/window/");
+        const data = await response.json();
+        data.pages.forEach(function (page) {
+            if (CACHE[page.slug] === undefined) {
+                CACHE[page.slug] = page;
+            }
+        });
+
+        NUM_ACTIVE_REQUESTS -= 1;
+        recalculateNavigationVisibility();
+    }
+
+    function preloadImage(pageData) {
+        // Offer the same candidates as the page's <picture>, so the browser picks (and caches) the one it will show
+        const sizes = document.getElementById("comic-image").sizes;
+        const picture = document.createElement("picture");
+        const source = document.createElement("source");
+        source.type = "image/webp";
+        source.sizes = sizes;
+        source.srcset = pageData.image_webp_srcset;
+        const img = new Image();
+        picture.append(source, img);
+        img.sizes = sizes;
+        img.srcset = pageData.image_srcset;
+        img.src = pageData.image;
     }
 
     // Implement keyboard navigation using the arrow keys
@@ -7,11 +7,12 @@ register = template.Library()
 
 
 def _snippet_base(context, location):
-    comic = context["request"].comic
+    request = context["request"]
     test_mode = context.get("testing", False)
-    snips = CodeSnippet.objects.for_comic(comic).filter(testing=test_mode)
-    snippet_string = "\n".join(s.code for s in snips.filter(location=location))
-    return mark_safe(snippet_string)
+    # Every snippet tag on the page shares one lookup
+    if getattr(request, "code_snippets", None) is None or request.code_snippets[0] != test_mode:
+        request.code_snippets = (test_mode, CodeSnippet.objects.by_location(request.comic, test_mode))
+    return mark_safe(request.code_snippets[1].get(location, ""))
 
 
 @register.simple_tag(takes_context=True)
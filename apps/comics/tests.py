@@ -1,3 +1,188 @@
-from django.test import TestCase
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from apps.comics.cloudflare_utilities import PurgeQueue, PURGE_FILES_PER_CALL
+from apps.comics.database import REPLICA, ReplicaRouter, primary_reads, replica_reads
+from apps.comics.models import Comic, Page, Tag, TagType
+
+
+class StubCloudflareHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.calls.append((self.path, self.headers["Authorization"], body))
+        status = self.server.statuses.pop(0) if self.server.statuses else 200
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(json.dumps({"success": status == 200, "errors": [{"message": "nope"}]}).encode())
+
+    def log_message(self, format, *args):
+        pass
+
+
+class PurgeQueueTests(SimpleTestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubCloudflareHandler)
+        self.server.calls = []
+        self.server.statuses = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        api_url = f"http://127.0.0.1:{self.server.server_port}"
+        self.queue = PurgeQueue(api_url=api_url, window=60, backoff=0.01)
+
+    def test_enqueue_does_not_block(self):
+        self.queue.enqueue("zone", "token", ["https://example.com/a/"])
+        self.assertEqual(self.server.calls, [])
+        self.queue.flush()
+        self.assertEqual(len(self.server.calls), 1)
+
+    def test_purges_are_coalesced_and_deduplicated(self):
+        self.queue.enqueue("zone", "token", ["https://example.com/a/", "https://example.com/b/"])
+        self.queue.enqueue("zone", "token", ["https://example.com/b/", "https://example.com/c/"])
+        self.queue.enqueue("other", "token2", ["https://example.org/a/"])
+        self.queue.flush()
+
+        calls = sorted(self.server.calls)
+        self.assertEqual(calls, [
+            ("/zones/other/purge_cache", "Bearer token2", {"files": ["https://example.org/a/"]}),
+            ("/zones/zone/purge_cache", "Bearer token", {"files": [
+                "https://example.com/a/", "https://example.com/b/", "https://example.com/c/"]}),
+        ])
+
+    def test_purge_everything_replaces_files(self):
+        self.queue.enqueue("zone", "token", ["https://example.com/a/"])
+        self.queue.enqueue("zone", "token", everything=True)
+        self.queue.enqueue("zone", "token", ["https://example.com/b/"])
+        self.queue.flush()
+        self.assertEqual([c[2] for c in self.server.calls], [{"purge_everything": True}])
+
+    def test_files_are_split_into_api_sized_calls(self):
+        files = [f"https://example.com/{i}/" for i in range(PURGE_FILES_PER_CALL * 2 + 1)]
+        self.queue.enqueue("zone", "token", files)
+        self.queue.flush()
+        self.assertEqual([len(c[2]["files"]) for c in self.server.calls], [PURGE_FILES_PER_CALL, PURGE_FILES_PER_CALL, 1])
+
+    def test_server_errors_are_retried(self):
+        self.server.statuses = [503, 429]
+        self.queue.enqueue("zone", "token", ["https://example.com/a/"])
+        self.queue.flush()
+        self.assertEqual(len(self.server.calls), 3)
+
+    def test_rejected_purges_are_not_retried(self):
+        self.server.statuses = [400]
+        self.queue.enqueue("zone", "token", ["https://example.com/a/"])
+        with self.assertLogs("apps.comics.cloudflare_utilities", "ERROR"):
+            self.queue.flush()
+        self.assertEqual(len(self.server.calls), 1)
+
+    def test_background_thread_sends_batches(self):
+        self.queue.window = 0.05
+        self.queue.enqueue("zone", "token", ["https://example.com/a/"])
+        # The worker thread never exits, so wait for its call to arrive instead
+        deadline = time.monotonic() + 5
+        while not self.server.calls and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(len(self.server.calls), 1)
+        self.queue.flush()
+        self.assertEqual(len(self.server.calls), 1)
+
+
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+        patcher = mock.patch.dict(settings.DATABASES, {REPLICA: settings.DATABASES['default']})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_reads_use_default_outside_reader_views(self):
+        self.assertIsNone(self.router.db_for_read(Page))
+
+    def test_reader_views_read_comics_from_replica(self):
+        with replica_reads():
+            self.assertEqual(self.router.db_for_read(Page), REPLICA)
+            self.assertIsNone(self.router.db_for_read(User))
+
+    def test_shared_cache_fills_read_from_default(self):
+        with replica_reads(), primary_reads():
+            self.assertIsNone(self.router.db_for_read(Page))
+
+    def test_without_replica_nothing_is_routed(self):
+        del settings.DATABASES[REPLICA]
+        with replica_reads():
+            self.assertIsNone(self.router.db_for_read(Page))
+
+    def test_writes_and_migrations_use_default(self):
+        with replica_reads():
+            self.assertEqual(self.router.db_for_write(Page), 'default')
+        self.assertFalse(self.router.allow_migrate(REPLICA, 'comics'))
+        self.assertIsNone(self.router.allow_migrate('default', 'comics'))
+
+
+# The routing table loads every comic and alias domain at once (and only once a minute per process)
+FULL_SCANS_ALLOWED = {"comics_comic", "comics_aliasurl"}
+
+
+@skipUnless(connection.vendor == "sqlite", "Reads SQLite query plans")
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}})
+class ReaderQueryPlanTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # The reader's templates expect the comic's images to be set, but never open them
+        images = ["header_image", "secret_image", "post_border_image", "navigation_spritesheet", "spinner_image",
+                  "favicon_image", "overflow_background_image", "archive_icon", "font"]
+        comic = Comic.objects.create(domain="testserver", title="Test", **{name: f"Test/{name}.png" for name in images})
+        tag_type = TagType.objects.create(comic=comic, title="Characters")
+        tag = Tag.objects.create(type=tag_type, title="Alice")
+        for i in range(3):
+            page = Page.objects.create(comic=comic, slug=f"page-{i}", title=f"Page {i}", ordering=i,
+                                       image=f"Test/images/page-{i}.png", post="Starring <Characters:Alice>")
+            page.tags.add(tag)
+
+    def assertNoFullScans(self, path, searches=()):
+        """Request `path`, and check that none of its queries read a whole table, and that they make `searches`."""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path, HTTP_HOST="testserver")
+            if response.streaming:
+                b"".join(response.streaming_content)
+        self.assertEqual(response.status_code, 200)
+
+        plan = []
+        with connection.cursor() as cursor:
+            for query in queries:
+                if not query["sql"].startswith("SELECT"):
+                    continue
+                cursor.execute(f"EXPLAIN QUERY PLAN {query['sql']}")
+                for *_, detail in cursor.fetchall():
+                    plan.append(detail)
+                    if detail.startswith("SCAN ") and detail.split()[1] not in FULL_SCANS_ALLOWED:
+                        self.fail(f"{path} scans a whole table ({detail}) in: {query['sql']}")
+        for search in searches:
+            self.assertTrue(any(search in detail for detail in plan), f"{path} doesn't search {search}")
+
+    def test_reader(self):
+        self.assertNoFullScans("/comic/page-1/", [
+            "comics_page_lower_slug_idx (comic_id=? AND <expr>=?)",
+            "comics_tag_lower_title_idx (type_id=? AND <expr>=?)",
+        ])
+
+    def test_page_data(self):
+        self.assertNoFullScans("/comic/data/page-1/")
+
+    def test_comic_data(self):
+        self.assertNoFullScans("/comic/data/")
+
+    def test_case_insensitive_lookups(self):
+        self.assertNoFullScans("/archive/Characters/Alice/", [
+            "comics_tagtype_lower_title_idx (<expr>=?)",
+            "comics_tag_lower_title_idx (type_id=? AND <expr>=?)",
+        ])
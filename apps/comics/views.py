@@ -1,8 +1,11 @@
-import itertools
 import json
+import random
 
 from django.conf import settings
-from django.db.models import Count
+from django.core.cache import cache
+from django.core.signing import BadSignature
+from django.core.paginator import InvalidPage, Paginator
+from django.db.models import CharField, Count, DateTimeField, IntegerField, Q, Value
 from django.http import HttpResponse, Http404, HttpResponseRedirect
 from django.shortcuts import get_object_or_404, render
 from django.template.defaultfilters import date
@@ -11,7 +14,9 @@ from django.utils.timezone import now
 from django.views import View
 from django.views.generic import TemplateView, RedirectView
 
-from apps.comics.models import Comic, Page, TagType, Tag, Ad, ShortCodeRedirect, AliasUrl
+from apps.comics import caching, database, navigation, routing, static_data
+from apps.comics.caching import cache_response, conditional_response
+from apps.comics.models import Comic, Page, TagType, Tag, Ad, ShortCodeRedirect, lower
 
 
 def require_comic(cls):
@@ -26,6 +31,13 @@ def require_comic(cls):
     return cls
 
 
+def read_from_replica(cls):
+    """A View class decorator that sends the view's reads to the replica database, if there is one. Only for public
+    views that never need to see a write the moment it's made. See `apps.comics.database.ReplicaRouter`."""
+    cls.use_replica = True
+    return cls
+
+
 class Redirect(Exception):
     def __init__(self, url):
         self.url = url
@@ -65,57 +77,81 @@ class ReaderRedirectView(RedirectView):
 
     def get_redirect_url(self, *args, **kwargs):
         comic = self.request.comic
-        page = comic.pages.active().order_by('-ordering').first()
+        page = navigation.get_navigation_index(comic).last
         if page is None:
             # But if there's no page, take us to the admin, I guess. TODO: Have a "no content" template
             return reverse("admin:index")
-        return self.request.build_absolute_uri(page.get_absolute_url())
+        return self.request.build_absolute_uri(reverse("reader", kwargs={"page": page.slug}))
 
 
-# TODO: Make this instead use an API to get all the pages, and randomly select one.
 @require_comic
 class RandomReaderRedirectView(RedirectView):
     """ If the user comes to this page, redirect that user to a random published comic.
+
+    If the comic uses a shuffle bag, the reader's place in their own shuffled order of the pages is kept in a signed
+    cookie, so they won't see a repeat until they've been through every page.
     """
     permanent = False
+    bag_cookie = "random-bag"
 
     def get_redirect_url(self, *args, **kwargs):
         comic = self.request.comic
-        page = comic.pages.active().order_by('?').first()
-        if page is None:
+        index = navigation.get_navigation_index(comic)
+        if not index:
             # But if there's no page, take us to the admin, I guess. TODO: Have a "no content" template
             return reverse("admin:index")
-        return self.request.build_absolute_uri(page.get_absolute_url())
+        if comic.random_shuffle_bag:
+            page = self._draw_from_bag(index.entries)
+        else:
+            page = random.choice(index.entries)
+        return self.request.build_absolute_uri(reverse("reader", kwargs={"page": page.slug}))
+
+    def _draw_from_bag(self, pages):
+        try:
+            seed, position = map(int, self.request.get_signed_cookie(self.bag_cookie).split(":"))
+        except (KeyError, ValueError, BadSignature):
+            seed, position = random.getrandbits(32), 0
+        if position >= len(pages):
+            seed, position = random.getrandbits(32), 0
+
+        # The same seed always shuffles the same pages into the same order
+        order = list(range(len(pages)))
+        random.Random(seed).shuffle(order)
+        self.bag_state = f"{seed}:{position + 1}"
+        return pages[order[position]]
 
     def dispatch(self, *args, **kwargs):
+        self.bag_state = None
         response = super().dispatch(*args, **kwargs)
-        response['Cache-Control'] = "max-age=600"  # 10 minutes
+        if self.bag_state is None:
+            response['Cache-Control'] = "max-age=600"  # 10 minutes
+        else:
+            response['Cache-Control'] = "private, no-store"
+            response.set_signed_cookie(self.bag_cookie, self.bag_state, max_age=60 * 60 * 24 * 365, samesite="Lax")
         return response
 
 
 def _get_navigation_pages(current_page):
-    comic = current_page.comic
+    index = navigation.get_navigation_index(current_page.comic)
     return {
-        "first": comic.pages.active().order_by('ordering').first(),
-        "previous": comic.pages.active().filter(
-            ordering__lt=current_page.ordering
-        ).order_by('-ordering').first(),
-        "next": comic.pages.active().filter(
-            ordering__gt=current_page.ordering
-        ).order_by('ordering').first(),
-        "last": comic.pages.active().order_by('-ordering').first(),
+        "first": index.first,
+        "previous": index.previous(current_page.ordering),
+        "next": index.next(current_page.ordering),
+        "last": index.last,
     }
 
 
+@read_from_replica
 @handle_redirect_exception
 @require_comic
+@cache_response
 class ReaderView(TemplateView):
     template_name = "comics/reader.html"
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         comic = self.request.comic
-        page = get_object_or_404(Page, comic=comic, slug__iexact=kwargs['page'])
+        page = get_object_or_404(Page, comic=comic, slug__lower=lower(kwargs['page']))
         if page.posted_at > now():
             raise Http404()
         # If we have an improper capitalization of the slug, instead redirect to the canonical capitalization
@@ -125,11 +161,15 @@ class ReaderView(TemplateView):
         context['comic'] = comic
         context['page'] = page
         context['nav'] = _get_navigation_pages(page)
-        context['ad'] = Ad.objects.filter(type="Banner").active(comic)
-        context['dialog_ad'] = Ad.objects.filter(type="Popup").active(comic)
+        context['static_data_url'] = static_data.get_url(comic) if settings.STATIC_PAGE_DATA else ""
+        context['ad'] = Ad.objects.pick(comic, "Banner")
+        context['dialog_ad'] = Ad.objects.pick(comic, "Popup")
         return context
 
 
+@read_from_replica
+@conditional_response
+@cache_response
 class FeedView(TemplateView):
     template_name = "comics/rss.xml"
 
@@ -147,33 +187,23 @@ class FeedView(TemplateView):
         return context
 
 
+@read_from_replica
 @handle_redirect_exception
+@conditional_response
 class ComicAjaxView(View):
     def get(self, request, *args, **kwargs):
         comic = request.comic
 
-        # Build the json
-        data = json.dumps({
-            "socialLinks": [{
-                "title": s.title or s.platform.name,
-                "image": s.platform.image.url if s.platform.image else "",
-                "visitUrl": s.visit_url,
-                "followUrl": s.follow_url or s.visit_url,
-                "shareUrlTemplate": s.platform.share_template,
-                "visitCta": s.visit_cta or s.platform.visit_cta,
-                "followCta": s.follow_cta or s.platform.follow_cta,
-                "shareCta": s.share_cta or s.platform.share_cta,
-                "requiresMoney": s.platform.requires_money,
-            } for s in comic.social_links.all()],
-            "pages": [p.slug for p in comic.pages.active()],
-        })
+        data = json.dumps(static_data.build_comic_data(comic, since=request.GET.get('since')))
 
         response = HttpResponse(data)
         response["Content-Type"] = "application/json"
         return response
 
 
+@read_from_replica
 @handle_redirect_exception
+@conditional_response
 class PageAjaxView(View):
     def get(self, request, *args, **kwargs):
         comic = request.comic
@@ -184,46 +214,41 @@ class PageAjaxView(View):
         if page.slug != kwargs['page']:
             raise Redirect(reverse('reader', kwargs={'page': page.slug}))
 
-        pages = _get_navigation_pages(page)
+        data = json.dumps(static_data.build_page_data(page))
 
-        # Compute tag data
-        # Sort tags by type, then popularity, then alphabetically
-        tags = page.tags.annotate(count=Count('pages')).order_by('type__title', '-count', 'title')
-        tag_types = itertools.groupby(tags, lambda _: _.type)
-        tag_type_data = [{"title": key.title, "tags": [{
-            "url": reverse("archive-tag", kwargs={"type": t.type.title, "tag": t.title}),
-            "title": t.title,
-            "icon": t.icon_url if t.icon_url else ""
-        } for t in value]} for key, value in tag_types]
+        response = HttpResponse(data)
+        response["Content-Type"] = "application/json"
+        return response
 
-        # Build the json
-        data = json.dumps({
-            "slug": page.slug,
-            "title": page.title,
-            "post": page.post_html,
-            "posted_at": date(page.posted_at),
-            "transcript": page.transcript_html,
-            "image": page.resized_image_url,
-            "alt_text": page.alt_text,
-            "tag_types": tag_type_data,
-
-            # Get the comic list
-            "first": pages['first'].slug if pages['first'] else None,
-            "previous": pages['previous'].slug if pages['previous'] else None,
-            "next": pages['next'].slug if pages['next'] else None,
-            "last": pages['last'].slug if pages['last'] else None,
-
-            # Admin edit link for those who have access
-            "admin": reverse("admin:comics_page_change", args=[page.id]),
-        })
 
-        response = HttpResponse(data)
+# How many pages either side of the requested one PageWindowAjaxView returns by default, and at most
+PAGE_WINDOW_RADIUS = 5
+MAX_PAGE_WINDOW_RADIUS = 20
+
+
+@read_from_replica
+@require_comic
+@conditional_response
+class PageWindowAjaxView(View):
+    """The metadata of a page and its neighbours in one response, so the reader can prefetch a run of pages at once."""
+    def get(self, request, *args, **kwargs):
+        try:
+            radius = min(int(request.GET.get('radius', PAGE_WINDOW_RADIUS)), MAX_PAGE_WINDOW_RADIUS)
+        except ValueError:
+            radius = PAGE_WINDOW_RADIUS
+        data = static_data.build_window_data(request.comic, kwargs['page'], max(radius, 0))
+        if data is None:
+            raise Http404()
+
+        response = HttpResponse(json.dumps(data))
         response["Content-Type"] = "application/json"
         return response
 
 
 @require_comic
 class TestView(ReaderView):
+    cache_responses = False
+
     def get_context_data(self, **kwargs):
         comic = self.request.comic
         page = comic.pages.active().order_by('-ordering').first()
@@ -233,7 +258,23 @@ class TestView(ReaderView):
         return context
 
 
+def _get_ad_context(comic, banner_override=None):
+    """The ads a cached page is rendered with, and the pools its script picks a new pair from on every visit. An
+    overridden banner is always shown, so only the popup is picked again then."""
+    ads = static_data.build_ad_data(comic)
+    if banner_override:
+        ads["Banner"] = []
+    return {
+        'ad': banner_override or Ad.objects.pick(comic, "Banner"),
+        'dialog_ad': Ad.objects.pick(comic, "Popup"),
+        'ads': ads,
+    }
+
+
+@read_from_replica
 @require_comic
+@conditional_response
+@cache_response
 class ArchiveView(TemplateView):
     template_name = "comics/archive/index.html"
 
@@ -241,12 +282,14 @@ class ArchiveView(TemplateView):
         context = super().get_context_data(**kwargs)
         comic = self.request.comic
         context['comic'] = comic
-        context['ad'] = Ad.objects.filter(type="Banner").active(comic)
-        context['dialog_ad'] = Ad.objects.filter(type="Popup").active(comic)
+        context['tag_types'] = TagType.objects.summaries(comic)
+        context['page_count'] = len(navigation.get_navigation_index(comic))
+        context.update(_get_ad_context(comic))
         return context
 
 
 @require_comic
+@cache_response
 class CommunityView(TemplateView):
     template_name = "comics/community.html"
 
@@ -257,38 +300,146 @@ class CommunityView(TemplateView):
         return context
 
 
+# How many pages and chapter headings each chunk of the page archive holds
+ARCHIVE_PAGE_SIZE = 200
+
+# The columns an ArchiveEntry is built from, in order
+ARCHIVE_ENTRY_FIELDS = ('ordering', 'title', 'slug', 'posted_at', 'thumbnail', 'image_width')
+
+
+class ArchiveEntry:
+    """A page or chapter heading in the page archive, duck-typed to look enough like a Page for the templates."""
+    thumbnail_field = Page._meta.get_field('thumbnail')
+
+    def __init__(self, url_template, ordering, title, slug, posted_at, thumbnail, image_width):
+        self.ordering = ordering
+        self.title = title
+        self.slug = slug
+        self.posted_at = posted_at
+        self.thumbnail = self.thumbnail_field.attr_class(None, self.thumbnail_field, thumbnail) if thumbnail else None
+        self.image_width = image_width
+        self.get_absolute_url = url_template.format(slug=slug) if slug else None
+
+    small_thumbnail_url = Page.small_thumbnail_url
+
+    @property
+    def is_chapter(self):
+        return self.posted_at is None
+
+
+def _reader_url_template():
+    """`reverse("reader")` as a format string, so building many page URLs doesn't need a `reverse` call each."""
+    placeholder = "__slug__"
+    return reverse("reader", kwargs={"page": placeholder}).replace(placeholder, "{slug}")
+
+
+def _get_archive_page(comic, number):
+    """One chunk of the comic's published pages and chapter headings, merged and sorted by the database."""
+    fields = ARCHIVE_ENTRY_FIELDS
+    pages = comic.pages.active().order_by().values_list(*fields)
+    chapters = comic.chapters.annotate(
+        slug=Value(None, output_field=CharField()),
+        posted_at=Value(None, output_field=DateTimeField()),
+        thumbnail=Value(None, output_field=CharField()),
+        image_width=Value(None, output_field=IntegerField()),
+    ).order_by().values_list(*fields)
+    paginator = Paginator(pages.union(chapters, all=True).order_by('ordering'), ARCHIVE_PAGE_SIZE)
+    try:
+        return paginator.page(number)
+    except InvalidPage:
+        raise Http404()
+
+
+def _get_tag_entries(comic, tag):
+    """The tag's published pages, from one query that's cached until anything on the comic changes."""
+    key = caching.comic_key(comic.id, "tag", tag.id, "pages")
+    rows = cache.get(key)
+    if rows is None:
+        with database.primary_reads():
+            rows = list(tag.pages.active().order_by('ordering').values_list(*ARCHIVE_ENTRY_FIELDS))
+        cache.set(key, rows, caching.get_timeout(comic))
+    url_template = _reader_url_template()
+    return [ArchiveEntry(url_template, *row) for row in rows]
+
+
+@read_from_replica
 @require_comic
+@conditional_response
+@cache_response
 class PageListView(TemplateView):
+    """The page archive shows one chunk of pages at a time. The filters script loads the following chunks from the
+    `archive-pages-data` endpoint."""
     template_name = "comics/archive/pages.html"
+    cache_query_params = ('page',)
 
     def get_context_data(self, **kwargs):
         comic = self.request.comic
-        pages = comic.pages.active()
-        chapters = comic.chapters.all()
-        pages_and_chapters = list(pages) + list(chapters)
-        pages_and_chapters.sort(key=lambda x: x.ordering)
+        archive_page = _get_archive_page(comic, self.request.GET.get('page', 1))
 
         context = super().get_context_data(**kwargs)
         context['comic'] = comic
-        context['pages_and_chapters'] = pages_and_chapters
+        context['archive_page'] = archive_page
+        url_template = _reader_url_template()
+        context['entries'] = [ArchiveEntry(url_template, *row) for row in archive_page.object_list]
+        if archive_page.has_next():
+            context['next_page_url'] = f"{reverse('archive-pages')}?page={archive_page.next_page_number()}"
+            context['next_data_url'] = f"{reverse('archive-pages-data')}?page={archive_page.next_page_number()}"
         context['breadcrumbs'] = [
             {'title': 'Archive', 'url': reverse('archive-index'),
              'icon': comic.archive_icon.url if comic.archive_icon else None},
         ]
-        context['ad'] = Ad.objects.filter(type="Banner").active(comic)
-        context['dialog_ad'] = Ad.objects.filter(type="Popup").active(comic)
+        context.update(_get_ad_context(comic))
         return context
 
 
+@read_from_replica
+@require_comic
+@conditional_response
+class PageListAjaxView(View):
+    def get(self, request, *args, **kwargs):
+        comic = request.comic
+        archive_page = _get_archive_page(comic, request.GET.get('page', 1))
+        url_template = _reader_url_template()
+        default_image = comic.archive_icon.url if comic.archive_icon else ""
+
+        entries = []
+        for row in archive_page.object_list:
+            entry = ArchiveEntry(url_template, *row)
+            if entry.is_chapter:
+                entries.append({"chapter": entry.title})
+            else:
+                entries.append({
+                    "title": entry.title,
+                    "url": entry.get_absolute_url,
+                    "image": entry.thumbnail.url if entry.thumbnail else default_image,
+                    "small_image": entry.small_thumbnail_url or "",
+                    "posted_at": date(entry.posted_at, "d M Y"),
+                })
+
+        # Build the json
+        data = json.dumps({
+            "entries": entries,
+            "next": f"{reverse('archive-pages-data')}?page={archive_page.next_page_number()}"
+                    if archive_page.has_next() else None,
+        })
+
+        response = HttpResponse(data)
+        response["Content-Type"] = "application/json"
+        return response
+
+
+@read_from_replica
 @handle_redirect_exception
 @require_comic
+@conditional_response
+@cache_response
 class TagTypeView(TemplateView):
     template_name = "comics/archive/tagtype.html"
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         comic = self.request.comic
-        tag_type = get_object_or_404(TagType, comic=comic, title__iexact=kwargs['type'])
+        tag_type = get_object_or_404(TagType, comic=comic, title__lower=lower(kwargs['type']))
 
         # If we have an improper capitalization of the tag, instead redirect to the canonical capitalization
         if tag_type.title != kwargs['type']:
@@ -296,43 +447,52 @@ class TagTypeView(TemplateView):
 
         context['comic'] = comic
         context['tag_type'] = tag_type
-        context['sorted_tags'] = tag_type.tags.annotate(count=Count('pages')).order_by('-count')
+        # Count only published pages, and load each tag's type (for its default icon) in the same query
+        context['sorted_tags'] = tag_type.tags.select_related('type').annotate(
+            count=Count('pages', filter=Q(pages__posted_at__lte=now()))
+        ).order_by('-count', 'title')
         context['breadcrumbs'] = [
             {'title': 'Archive', 'url': reverse('archive-index'),
              'icon': comic.archive_icon.url if comic.archive_icon else None},
         ]
-        context['ad'] = tag_type.ad_override if tag_type.ad_override else Ad.objects.filter(type="Banner").active(comic)
-        context['dialog_ad'] = Ad.objects.filter(type="Popup").active(comic)
+        context.update(_get_ad_context(comic, tag_type.ad_override))
         return context
 
 
+@read_from_replica
 @handle_redirect_exception
 @require_comic
+@conditional_response
+@cache_response
 class TagView(TemplateView):
     template_name = "comics/archive/tag.html"
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         comic = self.request.comic
-        tag_type = get_object_or_404(TagType, comic=comic, title__iexact=kwargs['type'])
-        tag = get_object_or_404(Tag, type=tag_type, title__iexact=kwargs['tag'])
+        tag_type = get_object_or_404(TagType, comic=comic, title__lower=lower(kwargs['type']))
+        tag = get_object_or_404(Tag, type=tag_type, title__lower=lower(kwargs['tag']))
 
         # If we have an improper capitalization of the tag, instead redirect to the canonical capitalization
         if tag_type.title != kwargs['type'] or tag.title != kwargs['tag']:
             raise Redirect(reverse('archive-tag', kwargs={'type': tag_type.title, 'tag': tag.title}))
 
+        # Save the template looking up the tag type again for the tag's icon
+        tag.type = tag_type
+        summary = next((s for s in TagType.objects.summaries(comic) if s['title'] == tag_type.title), {})
+
         context['comic'] = comic
         context['tag_type'] = tag_type
         context['tag'] = tag
+        context['entries'] = _get_tag_entries(comic, tag)
         context['breadcrumbs'] = [
             {'title': 'Archive', 'url': reverse('archive-index'),
              'icon': comic.archive_icon.url if comic.archive_icon else None},
             {'title': tag_type.title,
              'url': reverse('archive-tagtype', kwargs={'type': tag_type.title}),
-             'icon': tag_type.best_icon},
+             'icon': summary.get('icon')},
         ]
-        context['ad'] = tag.ad_override if tag.ad_override else Ad.objects.filter(type="Banner").active(comic)
-        context['dialog_ad'] = Ad.objects.filter(type="Popup").active(comic)
+        context.update(_get_ad_context(comic, tag.ad_override))
         return context
 
 
@@ -392,9 +552,7 @@ Sitemap: {reverse('sitemap')}
 def caddy_config(request):
     host = request.GET.get('domain')
 
-    if AliasUrl.objects.filter(domain=host).exists():
-        return HttpResponse(status=200)
-    if Comic.objects.filter(domain=host).exists():
+    if host in routing.get_routing_table():
         return HttpResponse(status=200)
 
     raise Http404()
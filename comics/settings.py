@@ -24,6 +24,12 @@ SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
 ADS_TXT_URL = os.getenv('DJANGO_ADS_TXT_URL', None)
 CSRF_TRUSTED_ORIGINS = []
 
+# Cloudflare configuration (the zone and token are set per Comic)
+CLOUDFLARE_API_URL = os.getenv('DJANGO_CLOUDFLARE_API_URL', 'https://api.cloudflare.com/client/v4')
+
+# Write each page's reader data to static files under the media directory, so the file server can answer page turns
+STATIC_PAGE_DATA = int(os.getenv('DJANGO_STATIC_PAGE_DATA', '0'))
+
 # Hosts
 ALLOWED_HOSTS = ['*']
 
@@ -48,6 +54,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'apps.comics.middleware.ComicUrlMiddleware',
+    'apps.comics.middleware.ReplicaMiddleware',
 ]
 
 # Paths to config modules
@@ -76,9 +83,49 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': f'/var/lib/django/{os.getenv("DJANGO_PROJECT_DIR")}.sqlite3',
+        # Keep each worker thread's connection open between requests, instead of reconnecting every time
+        'CONN_MAX_AGE': int(os.getenv('DJANGO_CONN_MAX_AGE', '600')),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # Seconds to wait for another process to finish writing before giving up
+            'timeout': 20,
+        },
     }
 }
 
+# Optionally, the public reader views can read from a second database, so their load scales separately from editing.
+# Point this at a copy of the database that is kept in sync with the primary, or at the primary itself for a separate
+# read-only connection. Writes, the admin and management commands always use 'default'.
+if os.getenv('DJANGO_DB_REPLICA'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.getenv('DJANGO_DB_REPLICA'),
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['apps.comics.database.ReplicaRouter']
+
+# Applied to every SQLite connection. WAL lets the gunicorn workers read while the admin writes, NORMAL only syncs at
+# checkpoints (safe in WAL mode), and the memory map and 64MB page cache keep hot pages out of read() calls.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,
+    'temp_store': 'MEMORY',
+} if int(os.getenv('DJANGO_SQLITE_TUNING', '1')) else {}
+
+# Cache
+# This is shared by all the gunicorn workers, so invalidating an entry in one process invalidates it for everyone.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': f'/var/lib/django/{os.getenv("DJANGO_PROJECT_DIR")}-cache',
+        'OPTIONS': {
+            # Rendered pages are cached too, so leave room for every page of a long comic
+            'MAX_ENTRIES': 20000,
+        },
+    }
+}
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
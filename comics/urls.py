@@ -22,6 +22,7 @@ urlpatterns = [
     path('comic/rss.xml', comics_views.FeedView.as_view(), name='feed-alt'),  # RSS Feed Alternate URL
     path('comic/data/', comics_views.ComicAjaxView.as_view(), name='comic-metadata'),
     path('comic/data/<slug:page>/', comics_views.PageAjaxView.as_view(), name='page-metadata'),
+    path('comic/data/<slug:page>/window/', comics_views.PageWindowAjaxView.as_view(), name='page-metadata-window'),
     path('comic/<slug:page>/', comics_views.ReaderView.as_view(), name='reader'),
 
     # Testing
@@ -30,6 +31,7 @@ urlpatterns = [
     # Tag Wiki Pages
     path('archive/', comics_views.ArchiveView.as_view(), name='archive-index'),
     path('archive/pages/', comics_views.PageListView.as_view(), name='archive-pages'),
+    path('archive/pages/data/', comics_views.PageListAjaxView.as_view(), name='archive-pages-data'),
     path('archive/<str:type>/', comics_views.TagTypeView.as_view(), name='archive-tagtype'),
     path('archive/<str:type>/<str:tag>/', comics_views.TagView.as_view(), name='archive-tag'),
 